@@ -1,5 +1,6 @@
 from flask import Flask
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_restx import Api
 from flask_pymongo import PyMongo
 from config import Config
@@ -7,20 +8,36 @@ from flask_mail import Mail
 from app.utils.init_db import init_database
 from app.services.service_container import ServiceContainer
 import certifi
-from app.utils.json_encoder import CustomJSONProvider
+import os
+from app.utils.json_encoder import CustomJSONProvider, output_json
+from app.utils.jwt_utils import JWTKeySet, VerifiedTokenCache
 from app.services.mail_service import MailService
+from app.commands import register_commands
 
 # Khai báo biến global
 mongo = None
 mail = None
 mail_service = None
+cache_service = None
+outbox_worker = None
+token_revocations = None
+password_hasher = None
+login_limiter = None
+category_diagnostics = None
 
 def create_app():
-    global mongo, mail, mail_service
+    global mongo, mail, mail_service, cache_service, outbox_worker, token_revocations, password_hasher, login_limiter, category_diagnostics
     # Initialize Flask app
     app = Flask(__name__)
     app.config.from_object(Config)
     app.config['MAIL_DEBUG'] = 0
+    if app.config['BEHIND_PROXY'] and not app.config['TRUSTED_PROXY_COUNT']:
+        # Không có ProxyFix thì mọi client chung IP của proxy và cùng bị giới hạn đăng nhập theo IP
+        raise RuntimeError('BEHIND_PROXY is set but TRUSTED_PROXY_COUNT is 0; set the number of trusted proxies')
+    if app.config['TRUSTED_PROXY_COUNT']:
+        # request.remote_addr là IP client do proxy tin cậy chuyển tiếp, không phải IP của proxy
+        proxies = app.config['TRUSTED_PROXY_COUNT']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
     CORS(app, resources={
         r"/api/*": {
             "origins": [
@@ -28,15 +45,20 @@ def create_app():
                 "http://localhost:3000"
             ],
             "methods": ["GET", "POST", "PUT", "DELETE"],
-            "allow_headers": ["Content-Type", "Authorization"]
+            "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"]
         }
     })
     app.json = CustomJSONProvider(app)
+    # Khoá ký JWT theo kid và cache claims đã xác thực cho token_required
+    app.extensions['jwt_keyset'] = JWTKeySet.from_config(app.config)
+    app.extensions['jwt_verified_cache'] = VerifiedTokenCache(app.config['JWT_VERIFIED_CACHE_SIZE'])
+    register_commands(app)
 
     # Initialize Flask-Mail
     mail = Mail()
     mail.init_app(app)
-    mail_service = MailService(mail)
+    # Email gửi từ outbox worker, dùng lại kết nối SMTP giữa các thư
+    mail_service = MailService(mail, idle_timeout=app.config['MAIL_IDLE_TIMEOUT'])
 
     # Kết nối MongoDB Atlas với SSL certificate
     mongo = PyMongo(app, tlsCAFile=certifi.where())
@@ -55,17 +77,25 @@ def create_app():
 
     from app.services import (
         CategoryService, 
+        CategoryDiagnostics,
         CustomerService,
         OrderService,
         PaymentService,
         ProductService,
         SettingService,
         CacheService,
-        StorageService
+        StorageService,
+        OutboxWorker,
+        TokenRevocationList,
+        PasswordHasher,
+        LoginRateLimiter
     )
 
     # Create service instances
-    category_service = CategoryService(mongo.db)
+    # Chẩn đoán truy vấn danh mục: một thread nền cho cả process, chỉ khi bật trong config
+    if app.config['CATEGORY_DIAGNOSTICS']:
+        category_diagnostics = CategoryDiagnostics(mongo.db)
+    category_service = CategoryService(mongo.db, diagnostics=category_diagnostics)
     customer_service = CustomerService(mongo.db)
     order_service = OrderService(mongo.db)
     payment_service = PaymentService(mongo.db)
@@ -74,6 +104,32 @@ def create_app():
     cache_service = CacheService(app.config)
     storage_service = StorageService(app.config)
 
+    # Danh sách token đã thu hồi (logout), đồng bộ giữa các worker qua Redis pub/sub
+    token_revocations = TokenRevocationList(
+        mongo.db, cache_service.redis, refresh_interval=app.config['TOKEN_REVOCATION_REFRESH']
+    ).start()
+
+    # Hash mật khẩu ngoài thread request, giới hạn số phép tính đang chờ
+    password_hasher = PasswordHasher(
+        method=app.config['PASSWORD_HASH_METHOD'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_pending=app.config['PASSWORD_HASH_MAX_PENDING']
+    )
+    login_limiter = LoginRateLimiter(
+        cache_service.redis,
+        window=app.config['LOGIN_RATE_WINDOW'],
+        ip_limit=app.config['LOGIN_RATE_LIMIT_IP'],
+        email_limit=app.config['LOGIN_RATE_LIMIT_EMAIL']
+    )
+
+    # Worker xử lý side effect (điểm thưởng, rollup, email) từ outbox
+    from app.services.outbox_handlers import register_default_handlers
+    outbox_worker = register_default_handlers(
+        OutboxWorker(mongo.db, app, workers=app.config['OUTBOX_WORKERS']), mail_service
+    )
+    if app.config['OUTBOX_WORKERS'] > 0:
+        outbox_worker.start()
+
     # Khởi tạo API với Swagger UI
     api = Api(app, 
         title='POS Store API',
@@ -81,9 +137,11 @@ def create_app():
         description='API Documentation for POS Store',
         doc='/api/docs'
     )
+    # Response của các Resource cũng đi qua orjson
+    api.representation('application/json')(output_json)
 
     # Import và đăng ký các namespaces
-    from app.routes import products, orders, customers, category, payment, setting, auth, upload
+    from app.routes import products, orders, customers, category, payment, setting, auth, upload, reports
 
     # Thêm các namespaces vào API
     api.add_namespace(auth.auth_ns, path='/api/auth')
@@ -94,13 +152,19 @@ def create_app():
     api.add_namespace(payment.payment_ns, path='/api/payment')
     api.add_namespace(setting.setting_ns, path='/api/setting')
     api.add_namespace(upload.upload_ns, path='/api/upload')
+    api.add_namespace(reports.reports_ns, path='/api/reports')
 
     # Health check endpoint
     @app.route('/ping')
     def ping():
         return {'message': 'API is running'}
+
+    # Thống kê hit/miss của cache (theo từng worker)
+    @app.route('/api/cache/stats')
+    def cache_stats():
+        return {'pid': os.getpid(), 'namespaces': cache_service.get_stats()}
     
     return app
 
 # Export create_app function
-__all__ = ['create_app', 'mongo', 'mail_service']
\ No newline at end of file
+__all__ = ['create_app', 'mongo', 'mail_service', 'cache_service', 'outbox_worker', 'token_revocations', 'password_hasher', 'login_limiter', 'category_diagnostics']
\ No newline at end of file
@@ -0,0 +1,75 @@
+import click
+from flask.cli import AppGroup
+
+indexes_cli = AppGroup('indexes', help='Quản lý index MongoDB')
+
+@indexes_cli.command('ensure')
+def ensure_indexes_command():
+    """Tạo các index đã khai báo nhưng còn thiếu"""
+    from app import mongo
+    from app.utils.index_utils import ensure_indexes
+
+    created = ensure_indexes(mongo.db)
+    for collection, name in created:
+        click.echo(f'created {collection}.{name}')
+    click.echo(f'{len(created)} index(es) created')
+
+@indexes_cli.command('advise')
+def advise_indexes_command():
+    """Chạy explain() trên các truy vấn chuẩn và báo các truy vấn COLLSCAN"""
+    from app import mongo
+    from app.utils.index_utils import advise_indexes
+
+    reports = advise_indexes(mongo.db)
+    collscans = 0
+    for report in reports:
+        if report['error']:
+            status = 'ERROR'
+        elif report['collscan']:
+            status = 'COLLSCAN'
+            collscans += 1
+        else:
+            status = 'ok'
+        click.echo(f"{status:<9} {report['collection']}.{report['name']}: {' > '.join(report['stages']) or report['error']}")
+
+    click.echo(f'{collscans} of {len(reports)} queries use a collection scan')
+    if collscans:
+        raise SystemExit(1)
+
+products_cli = AppGroup('products', help='Tiện ích dữ liệu sản phẩm')
+
+@products_cli.command('reindex-search')
+def reindex_search_command():
+    """Tính lại token tìm kiếm (bỏ dấu, prefix) cho toàn bộ sản phẩm"""
+    from app import mongo
+    from app.services.product_service import ProductService
+
+    updated = ProductService(mongo.db).reindex_search()
+    click.echo(f'{updated} product(s) reindexed')
+
+reports_cli = AppGroup('reports', help='Báo cáo doanh thu')
+
+@reports_cli.command('rebuild-sales')
+def rebuild_sales_command():
+    """Dựng lại rollup sales_daily từ toàn bộ đơn hàng completed"""
+    from app import mongo
+    from app.services.report_service import ReportService
+
+    rows = ReportService(mongo.db).rebuild_sales_daily()
+    click.echo(f'sales_daily rebuilt with {rows} row(s)')
+
+outbox_cli = AppGroup('outbox', help='Xử lý event trong outbox')
+
+@outbox_cli.command('drain')
+def drain_outbox_command():
+    """Xử lý đồng bộ toàn bộ event đang chờ (thay cho worker pool)"""
+    from app import outbox_worker
+
+    processed = outbox_worker.drain()
+    click.echo(f'{processed} event(s) processed')
+
+def register_commands(app):
+    app.cli.add_command(indexes_cli)
+    app.cli.add_command(products_cli)
+    app.cli.add_command(reports_cli)
+    app.cli.add_command(outbox_cli)
@@ -8,6 +8,7 @@ class Category:
                  icon: str = None,
                  color: str = None,
                  parent_id: ObjectId = None,
+                 active: bool = True,
                  _id: ObjectId = None):
         self._id = _id or ObjectId()
         self.name = name
@@ -15,6 +16,7 @@ class Category:
         self.icon = icon
         self.color = color
         self.parent_id = parent_id
+        self.active = active
         self.created_at = datetime.now(timezone.utc)
         self.updated_at = datetime.now(timezone.utc)
 
@@ -24,6 +26,7 @@ class Category:
             'description': self.description,
             'icon': self.icon,
             'color': self.color,
+            'active': self.active,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -1,5 +1,4 @@
 from datetime import datetime
-import random
 from bson import ObjectId
 from typing import List, Dict
 
@@ -25,9 +24,11 @@ class Order:
                  status: str = 'pending',
                  notes: str = None,
                  created_by: str = None,
+                 order_number: str = None,
                  _id: ObjectId = None):
         self._id = _id or ObjectId()
-        self.order_number = self.generate_order_number()
+        # Số đơn do OrderNumberGenerator cấp (app/utils/order_utils.py)
+        self.order_number = order_number
         self.customer_id = ObjectId(customer_id) if customer_id else None
         self.items = items
         self.payment_method = payment_method
@@ -42,19 +43,26 @@ class Order:
         self.tax = 0
         self.total = self.subtotal + self.tax
         
-    def to_dict(self) -> Dict:
+    def to_dict(self, for_api=True) -> Dict:
+        if for_api:
+            # Chuyển đổi sang string khi trả về API
+            to_id = lambda value: str(value) if value else None
+        else:
+            # Giữ nguyên ObjectId khi lưu DB
+            to_id = lambda value: value
+
         return {
-            '_id': str(self._id),
+            '_id': to_id(self._id),
             'order_number': self.order_number,
-            'customer_id': str(self.customer_id) if self.customer_id else None,
-            'items': [vars(item) for item in self.items],
+            'customer_id': to_id(self.customer_id),
+            'items': [dict(vars(item)) for item in self.items],
             'subtotal': self.subtotal,
             'tax': self.tax,
             'total': self.total,
             'payment_method': self.payment_method,
             'status': self.status,
             'notes': self.notes,
-            'created_by': str(self.created_by) if self.created_by else None,
+            'created_by': to_id(self.created_by),
             'created_at': self.created_at,
             'updated_at': self.updated_at
         }
@@ -67,6 +75,8 @@ class Order:
         return Order(items=items, **data)
 
     def validate(self):
+        if not self.order_number:
+            raise ValueError("Order number is required")
         if not self.items:
             raise ValueError("Order must have at least one item")
         if self.status not in ['pending', 'completed', 'cancelled']:
@@ -74,12 +84,6 @@ class Order:
         if self.payment_method not in ['cash', 'card', 'transfer']:
             raise ValueError("Invalid payment method")
 
-    @staticmethod
-    def generate_order_number() -> str:
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        random_number = ''.join(random.choices('0123456789', k=4))
-        return f'ORD{timestamp}{random_number}'
-
     def complete(self):
         self.status = 'completed'
         self.updated_at = datetime.utcnow()
@@ -1,9 +1,9 @@
 from flask_restx import Namespace
-from app import mongo, mail_service
+from app import mongo, mail_service, token_revocations, password_hasher
 from app.services import AuthService
 
 # Khởi tạo services
-auth_service = AuthService(mongo.db, mail_service)
+auth_service = AuthService(mongo.db, mail_service, revocations=token_revocations, hasher=password_hasher)
 
 # Initialize namespaces
 auth_ns = Namespace('auth', description='Authentication operations', path='/api/auth')
@@ -12,6 +12,7 @@ customers_ns = Namespace('customers', description='Customer operations', path='/
 orders_ns = Namespace('orders', description='Order operations', path='/api/orders')
 payment_ns = Namespace('payments', description='Payment operations', path='/api/payments')
 products_ns = Namespace('products', description='Product operations', path='/api/products')
+reports_ns = Namespace('reports', description='Reports operations', path='/api/reports')
 setting_ns = Namespace('settings', description='Settings operations', path='/api/settings')
 
 # Import routes
@@ -21,6 +22,7 @@ from . import customers
 from . import orders
 from . import payment
 from . import products
+from . import reports
 from . import setting
 
 __all__ = [
@@ -30,5 +32,6 @@ __all__ = [
     'orders_ns',
     'payment_ns',
     'products_ns',
+    'reports_ns',
     'setting_ns'
 ]
\ No newline at end of file
@@ -1,15 +1,28 @@
 from flask_restx import Namespace, Resource, fields
-from flask import request
-from app import services, mongo
+from flask import current_app, request, g
+from app import mongo, token_revocations, login_limiter
+from app.routes import auth_service
 from app.utils.auth_utils import token_required
+from app.services.token_revocation import token_jti
+from app.services.password_hasher import PasswordHasherBusy
 import logging
-from datetime import datetime, timezone
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 auth_ns = Namespace('auth', description='Authentication operations')
 
+_untrusted_proxy_warned = False
+
+def _warn_untrusted_proxy():
+    """Request có X-Forwarded-For nhưng chưa cấu hình proxy tin cậy: cảnh báo một lần"""
+    global _untrusted_proxy_warned
+    if not _untrusted_proxy_warned and 'X-Forwarded-For' in request.headers \
+            and not current_app.config['TRUSTED_PROXY_COUNT']:
+        _untrusted_proxy_warned = True
+        logger.warning('Login request carries X-Forwarded-For but TRUSTED_PROXY_COUNT is 0: '
+                       'the per-IP login limit counts the proxy address; set TRUSTED_PROXY_COUNT')
+
 @auth_ns.route('/login')
 class Login(Resource):
     @auth_ns.expect(auth_ns.model('Login', {
@@ -28,10 +41,20 @@ class Login(Resource):
             if 'password' not in data:
                 return {'message': 'Password is required'}, 400
                 
-            result = services.auth_service.login(data['email'], data['password'])
+            # Chặn trước khi tra database hay tính hash
+            _warn_untrusted_proxy()
+            retry_after = login_limiter.hit(request.remote_addr or '', data['email'])
+            if retry_after:
+                return {'message': 'Too many login attempts, please retry later'}, 429, {'Retry-After': str(retry_after)}
+
+            result = auth_service.login(data['email'], data['password'])
             if result:
+                login_limiter.reset(data['email'])
                 return result
             return {'message': 'Invalid credentials'}, 401
+        except PasswordHasherBusy:
+            # Hàng đợi hash đầy: từ chối ngay, client thử lại sau
+            return {'message': 'Server is busy, please retry'}, 429, {'Retry-After': '1'}
         except Exception as e:
             return {'message': f'Login failed: {str(e)}'}, 500
         
@@ -55,17 +78,9 @@ class Logout(Resource):
 
     @token_required
     def post(self):
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]  # Lấy phần token sau 'Bearer '
-
-            mongo.db.revoked_tokens.insert_one({
-                'token': token,
-                'revoked_at': datetime.now(timezone.utc)
-            })
-            return {'message': 'Logged out successfully'}, 200
-        else:
-            return {'message': 'Unauthorized - Invalid or missing token'}, 401
+        # token_required đã xác thực token và lưu claims vào g
+        token_revocations.revoke(token_jti(g.token, g.token_claims), g.token_claims['exp'])
+        return {'message': 'Logged out successfully'}, 200
         
 @auth_ns.route('/register')
 class Register(Resource):
@@ -91,12 +106,15 @@ class Register(Resource):
             if not '@' in data['email']:
                 return {'message': 'Invalid email format'}, 400
                 
-            user = services.auth_service.register(data)
+            user = auth_service.register(data)
             if not user:
                 return {'message': 'Email already registered'}, 409
                 
             return {'message': 'User registered successfully', 'user': user}, 201
             
+        except PasswordHasherBusy:
+            # Hàng đợi hash đầy: từ chối ngay, client thử lại sau
+            return {'message': 'Server is busy, please retry'}, 429, {'Retry-After': '1'}
         except Exception as e:
             return {'message': f'Registration failed: {str(e)}'}, 500
         
@@ -129,7 +147,7 @@ class ResetPasswordRequest(Resource):
     }))
     def post(self):
         data = request.get_json()
-        if services.auth_service.reset_password_request(data['email']):
+        if auth_service.reset_password_request(data['email']):
             return {'message': 'Reset password email sent'}
         return {'message': 'Email not found'}, 404
 
@@ -140,6 +158,6 @@ class ResetPassword(Resource):
     }))
     def post(self, token):
         data = request.get_json()
-        if services.auth_service.reset_password(token, data['new_password']):
+        if auth_service.reset_password(token, data['new_password']):
             return {'message': 'Password reset successfully'}
         return {'message': 'Invalid or expired token'}, 400
\ No newline at end of file
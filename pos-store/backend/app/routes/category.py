@@ -1,7 +1,8 @@
 from flask_restx import Namespace, Resource, fields
 from flask import request, abort
-from app import mongo
+from app import mongo, cache_service, category_diagnostics
 from app.services import CategoryService
+from bson import ObjectId
 import logging
 
 # Initialize logger
@@ -9,7 +10,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 category_ns = Namespace('categories', description='Category operations')
-category_service = CategoryService(mongo.db)
+category_service = CategoryService(mongo.db, cache=cache_service, diagnostics=category_diagnostics)
 
 @category_ns.route('/')
 class CategoryList(Resource):
@@ -36,7 +37,8 @@ class CategoryList(Resource):
         'description': fields.String(description='Category description'),
         'icon': fields.String(description='Category icon'),
         'color': fields.String(description='Category color'),
-        'parent_id': fields.String(description='Parent category ID')
+        'parent_id': fields.String(description='Parent category ID'),
+        'active': fields.Boolean(description='Category is active', default=True)
     }))
     @category_ns.doc(responses={201: 'Category created', 400: 'Bad request'})
     def post(self):
@@ -47,7 +49,10 @@ class CategoryList(Resource):
             return {'message': 'Name is required'}, 400
         
         logger.info(f'Creating category with data: {data}')
-        category = category_service.create_category(data)
+        try:
+            category = category_service.create_category(data)
+        except ValueError as e:
+            abort(400, str(e))
         logger.debug('Category created successfully')
         if category:
             return category.to_dict(), 201
@@ -64,10 +69,6 @@ class Category(Resource):
         }
     )
     def get(self, id):
-        # Thêm log để hiển thị tất cả category IDs
-        all_categories = category_service.get_all_category_ids()
-        logger.debug(f"Tất cả category IDs: {all_categories}")
-        
         category = category_service.get_category(id)
         if not category:
             abort(404, f"Không tìm thấy danh mục với ID: {id}")
@@ -77,6 +78,7 @@ class Category(Resource):
         description='Cập nhật thông tin danh mục',
         responses={
             200: 'Cập nhật thành công',
+            400: 'Dữ liệu không hợp lệ',
             404: 'Không tìm thấy danh mục'
         }
     )
@@ -85,11 +87,15 @@ class Category(Resource):
         'description': fields.String(description='Mô tả'),
         'icon': fields.String(description='Icon'),
         'color': fields.String(description='Màu sắc'),
-        'parent_id': fields.String(description='ID danh mục cha')
+        'parent_id': fields.String(description='ID danh mục cha'),
+        'active': fields.Boolean(description='Đang hoạt động')
     }))
     def put(self, id):
         data = request.get_json()
-        category = category_service.update_category(id, data)
+        try:
+            category = category_service.update_category(id, data)
+        except ValueError as e:
+            abort(400, str(e))
         if not category:
             abort(404, 'Không tìm thấy danh mục')
         return category
@@ -116,9 +122,18 @@ class CategoryTree(Resource):
         'depth': {'description': 'Độ sâu tối đa của cây', 'type': 'integer', 'default': 3}
     })
     def get(self):
-        active = request.args.get('active', type=bool)
+        active = request.args.get('active')
+        if active is not None:
+            active = active.lower() == 'true'
         parent_id = request.args.get('parent_id')
         depth = request.args.get('depth', default=3, type=int)
-        
-        tree = category_service.get_category_tree(active, parent_id, depth)
+
+        if parent_id and not ObjectId.is_valid(parent_id):
+            abort(400, 'parent_id không hợp lệ')
+        if depth < 1:
+            abort(400, 'depth phải lớn hơn 0')
+
+        tree = category_service.get_category_tree(active, parent_id or None, depth)
+        if tree is None:
+            abort(404, f"Không tìm thấy danh mục với ID: {parent_id}")
         return tree
\ No newline at end of file
@@ -1,10 +1,14 @@
-from flask import request
+from flask import request, current_app, Response, stream_with_context
 from flask_restx import Resource, Namespace, fields
-from app import mongo
-from app.services.order_service import OrderService
+from app import mongo, cache_service
+from app.services.order_service import (
+    OrderService, InsufficientStockError, EXPORT_FORMATS, ORDER_EXPORT_COLUMNS, order_export_rows
+)
+from app.utils.export_utils import iter_ndjson, iter_csv, gzip_stream
+from app.utils.idempotency_utils import idempotent
 
 orders_ns = Namespace('orders', description='Orders operations')
-order_service = OrderService(mongo.db)
+order_service = OrderService(mongo.db, cache=cache_service)
 
 # Model cho OrderItem
 order_item_model = orders_ns.model('OrderItem', {
@@ -34,7 +38,9 @@ class OrderList(Resource):
             'start_date': 'Ngày bắt đầu (YYYY-MM-DD)',
             'end_date': 'Ngày kết thúc (YYYY-MM-DD)',
             'page': 'Số trang',
-            'limit': 'Số lượng item mỗi trang'
+            'limit': 'Số lượng item mỗi trang',
+            'cursor': 'Cursor phân trang (để trống để lấy trang đầu, dùng next_cursor cho trang sau)',
+            'count': 'Cách tính tổng số: exact, estimated, cached (mặc định), none'
         })
     def get(self):
         """Lấy danh sách đơn hàng"""
@@ -46,18 +52,67 @@ class OrderList(Resource):
         }
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 20))
+        cursor = request.args.get('cursor')
+        count = request.args.get('count', 'cached')
         
-        result = order_service.get_orders(filters, page, limit)
+        try:
+            result = order_service.get_orders(filters, page, limit, cursor=cursor, count=count)
+        except ValueError as e:
+            orders_ns.abort(400, str(e))
         return result
 
     @orders_ns.doc('create_order')
     @orders_ns.expect(order_model)
+    @idempotent(mongo.db)
     def post(self):
         """Tạo đơn hàng mới"""
         data = request.get_json()
-        order = order_service.create_order(data)
+        try:
+            order = order_service.create_order(data)
+        except InsufficientStockError as e:
+            orders_ns.abort(409, str(e), failures=e.failures)
         return order, 201
 
+@orders_ns.route('/export')
+class OrderExport(Resource):
+    @orders_ns.doc('export_orders',
+        params={
+            'format': 'ndjson (mặc định) hoặc csv (mỗi dòng một item)',
+            'status': 'Lọc theo trạng thái đơn hàng',
+            'customer_id': 'Lọc theo khách hàng',
+            'start_date': 'Từ ngày (YYYY-MM-DD)',
+            'end_date': 'Đến hết ngày (YYYY-MM-DD)'
+        })
+    def get(self):
+        """Export đơn hàng dạng stream (gzip nếu client hỗ trợ)"""
+        format = request.args.get('format', 'ndjson').lower()
+        if format not in EXPORT_FORMATS:
+            orders_ns.abort(400, "Unsupported export format")
+
+        filters = {
+            'status': request.args.get('status'),
+            'customer_id': request.args.get('customer_id'),
+            'start_date': request.args.get('start_date'),
+            'end_date': request.args.get('end_date')
+        }
+        try:
+            orders = order_service.export_orders(filters)
+        except ValueError as e:
+            orders_ns.abort(400, str(e))
+
+        if format == 'csv':
+            chunks = iter_csv(orders, ORDER_EXPORT_COLUMNS, order_export_rows)
+            mimetype = 'text/csv'
+        else:
+            chunks = iter_ndjson(orders, current_app.json.dumps_bytes)
+            mimetype = 'application/x-ndjson'
+
+        headers = {'Content-Disposition': f'attachment; filename=orders.{format}', 'Vary': 'Accept-Encoding'}
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            chunks = gzip_stream(chunks)
+            headers['Content-Encoding'] = 'gzip'
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
 @orders_ns.route('/<id>')
 @orders_ns.param('id', 'Order ID')
 class Order(Resource):
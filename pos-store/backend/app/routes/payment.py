@@ -2,6 +2,7 @@ from flask import request
 from flask_restx import Namespace, Resource, fields
 from app import mongo
 from app.services import PaymentService
+from app.utils.idempotency_utils import idempotent
 
 payment_ns = Namespace('payment', description='Payment operations')
 payment_service = PaymentService(mongo.db)
@@ -27,6 +28,7 @@ class ProcessPayment(Resource):
         'amount': fields.Float(required=True, description='Payment amount'),
         'method': fields.String(required=True, description='Payment method')
     }))
+    @idempotent(mongo.db)
     def post(self, order_number):
         """Xử lý thanh toán cho đơn hàng"""
         data = request.get_json()
@@ -38,6 +40,7 @@ class ProcessPayment(Resource):
 @payment_ns.route('/order/<order_number>/verify')
 class VerifyPayment(Resource):
     @payment_ns.doc('verify_payment')
+    @idempotent(mongo.db)
     def post(self, order_number):
         """Xác nhận thanh toán"""
         data = request.get_json()
@@ -49,6 +52,7 @@ class VerifyPayment(Resource):
 @payment_ns.route('/refund/<order_number>')
 class RefundPayment(Resource):
     @payment_ns.doc('refund_payment')
+    @idempotent(mongo.db)
     def post(self, order_number):
         """Hoàn tiền"""
         data = request.get_json()
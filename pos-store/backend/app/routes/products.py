@@ -1,10 +1,13 @@
 from flask import request
+import io
 from flask_restx import Resource, Namespace, fields
-from app import mongo
+from app import mongo, cache_service
 from app.services.product_service import ProductService
+from app.services.barcode_index import BarcodeIndex
 
 products_ns = Namespace('products', description='Product operations')
-product_service = ProductService(mongo.db)
+barcode_index = BarcodeIndex(mongo.db).start()
+product_service = ProductService(mongo.db, barcode_index=barcode_index, cache=cache_service)
 
 # Product model parameters
 product_model = products_ns.model('Product', {
@@ -111,3 +114,21 @@ class ProductBatch(Resource):
         data = request.get_json()
         result = product_service.batch_update(data)
         return result
+
+
+@products_ns.route('/import')
+class ProductImport(Resource):
+    @products_ns.doc('import_products')
+    @products_ns.param('format', 'csv (header: product_id,quantity,price,cost_price,is_active) hoặc ndjson',
+                       default='csv')
+    def post(self):
+        """
+        Import cập nhật sản phẩm từ file nhà cung cấp (đọc stream, không nạp cả file)
+        """
+        format = request.args.get('format', 'csv').lower()
+        if format not in ('csv', 'ndjson'):
+            products_ns.abort(400, "Unsupported import format")
+
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+        result = product_service.import_products(stream, format)
+        return result
@@ -0,0 +1,31 @@
+from flask import request
+from flask_restx import Namespace, Resource
+from datetime import datetime, timedelta
+from app import mongo
+from app.services import ReportService
+
+reports_ns = Namespace('reports', description='Reports operations')
+report_service = ReportService(mongo.db)
+
+@reports_ns.route('/sales')
+class SalesReport(Resource):
+    @reports_ns.doc('get_sales_report',
+        params={
+            'start_date': 'Từ ngày (YYYY-MM-DD, mặc định 30 ngày trước)',
+            'end_date': 'Đến ngày (YYYY-MM-DD, mặc định hôm nay)',
+            'top': 'Số sản phẩm bán chạy trả về (mặc định 10)'
+        })
+    def get(self):
+        """Doanh thu theo ngày, phương thức thanh toán và sản phẩm (đọc từ rollup sales_daily)"""
+        today = datetime.utcnow()
+        start_date = request.args.get('start_date') or (today - timedelta(days=30)).strftime('%Y-%m-%d')
+        end_date = request.args.get('end_date') or today.strftime('%Y-%m-%d')
+        top = request.args.get('top', '10')
+        if not top.isdigit() or int(top) < 1:
+            reports_ns.abort(400, 'top must be a positive integer')
+        top = int(top)
+
+        try:
+            return report_service.get_sales(start_date, end_date, top)
+        except ValueError as e:
+            reports_ns.abort(400, str(e))
@@ -1,10 +1,10 @@
 from flask import request
 from flask_restx import Namespace, Resource
-from app import mongo
+from app import mongo, cache_service
 from app.services import SettingService
 
 setting_ns = Namespace('settings', description='Settings operations')
-setting_service = SettingService(mongo.db)
+setting_service = SettingService(mongo.db, cache=cache_service)
 
 @setting_ns.route('/')
 class Settings(Resource):
@@ -1,5 +1,5 @@
 from .auth_service import AuthService
-from .category_service import CategoryService
+from .category_service import CategoryService, CategoryDiagnostics
 from .customer_service import CustomerService
 from .order_service import OrderService
 from .payment_service import PaymentService
@@ -7,15 +7,29 @@ from .product_service import ProductService
 from .setting_service import SettingService
 from .cache import CacheService
 from .storage import StorageService
+from .barcode_index import BarcodeIndex
+from .report_service import ReportService
+from .outbox import OutboxWorker
+from .token_revocation import TokenRevocationList
+from .password_hasher import PasswordHasher, PasswordHasherBusy
+from .login_limiter import LoginRateLimiter
 
 __all__ = [
     'AuthService',
     'CategoryService',
+    'CategoryDiagnostics',
     'CustomerService', 
     'OrderService',
     'PaymentService',
     'ProductService',
     'SettingService',
     'CacheService',
-    'StorageService'
+    'StorageService',
+    'BarcodeIndex',
+    'ReportService',
+    'OutboxWorker',
+    'TokenRevocationList',
+    'PasswordHasher',
+    'PasswordHasherBusy',
+    'LoginRateLimiter'
 ]
@@ -1,35 +1,47 @@
 from app.models.auth import User
 from app.utils.jwt_utils import generate_token, verify_token
-from app.utils.password_utils import hash_password, verify_password
+from app.services.password_hasher import PasswordHasher
+from app.utils.index_utils import declare_index, declare_query
+from app.utils.transaction_utils import run_in_transaction
+from app.services.outbox import publish_event
+from app.services.outbox_handlers import USER_REGISTERED
+from app.services.token_revocation import TokenRevocationList, token_jti
 from flask import current_app
 from datetime import datetime
 import secrets
 
+declare_index('users', 'email', unique=True)
+declare_query('by_email', 'users', {'email': ''})
+
 class AuthService:
-    def __init__(self, db, mail_service):
+    def __init__(self, db, mail_service, revocations=None, hasher=None):
         self.db = db
         self.mail_service = mail_service
+        self.hasher = hasher or PasswordHasher(workers=0)
+        # Chưa start thì TokenRevocationList tra thẳng revoked_tokens theo _id (có index)
+        self.revocations = revocations or TokenRevocationList(db)
 
     def login(self, email, password):
         user = self.db.users.find_one({'email': email})
-        if user and verify_password(password, user['password']):
-            # Lấy JWT secret key từ config
-            jwt_secret = current_app.config['JWT_SECRET_KEY']
-            token = generate_token(user, jwt_secret)
+        if user and self.hasher.verify(password, user['password']):
+            if self.hasher.needs_rehash(user['password']):
+                # Nâng cấp hash lên thuật toán/cost hiện tại khi đã có mật khẩu gốc
+                self.db.users.update_one(
+                    {'_id': user['_id'], 'password': user['password']},
+                    {'$set': {'password': self.hasher.hash(password)}}
+                )
+            # Ký bằng khoá active trong keyset (JWT_SIGNING_KEYS), mặc định là JWT_SECRET_KEY
+            token = current_app.extensions['jwt_keyset'].generate_token(user)
             user['last_login'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
             self.db.users.update_one({'_id': user['_id']}, {'$set': {'last_login': user['last_login']}})
             return {'token': token, 'user': User.clean_user_data(user)}
         return None
     
-    def is_token_revoked(self, token):
-        revoked_token = self.db.revoked_tokens.find_one({'token': token})
-        return revoked_token is not None
+    def is_token_revoked(self, token, claims):
+        return self.revocations.is_revoked(token_jti(token, claims))
 
-    def logout(self, token):
-        self.db.revoked_tokens.insert_one({
-            'token': token,
-            'revoked_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-        })
+    def logout(self, token, claims):
+        self.revocations.revoke(token_jti(token, claims), claims['exp'])
 
     def register(self, user_data):
         # Kiểm tra email đã tồn tại
@@ -51,7 +63,7 @@ class AuthService:
         # Tạo user mới
         user = {
             'email': user_data['email'],
-            'password': hash_password(user_data['password']),
+            'password': self.hasher.hash(user_data['password']),
             'name': user_data.get('name', ''),
             'role': user_data.get('role', 'user'),
             'active': False,
@@ -63,25 +75,18 @@ class AuthService:
         
         user['verification_token'] = verification_token
         
+        def create_user(session):
+            self.db.users.insert_one(user, session=session)
+            # Email xác thực được outbox worker gửi sau khi commit, request không chờ SMTP
+            publish_event(self.db, USER_REGISTERED, {'email': user['email'], 'token': verification_token},
+                          session=session)
+
         try:
-            result = self.db.users.insert_one(user)
-            user['_id'] = str(result.inserted_id)
+            run_in_transaction(self.db, create_user)
         except Exception as e:
             current_app.logger.error(f"Error creating user: {str(e)}")
             return {'status': 400, 'message': 'Error creating user'}
 
-        # Gửi email xác thực
-        try:
-            current_app.logger.info(f"Attempting to send verification email to: {user['email']}")
-            self.mail_service.send_verification_email(user['email'], verification_token)
-            current_app.logger.info(f"Successfully sent verification email to: {user['email']}")
-        except Exception as e:
-            current_app.logger.error(f"Error sending verification email: {str(e)}")
-            current_app.logger.error(f"Error details: {e.__class__.__name__}")
-            # Xoá user nếu gửi email thất bại
-            self.db.users.delete_one({'_id': result.inserted_id})
-            return {'status': 400, 'message': 'Error sending verification email'}
-            
         return {'message': 'Please check your email to verify account'}
     
     def verify_email(self, token):
@@ -106,11 +111,11 @@ class AuthService:
 
     def change_password(self, user_id: str, old_password: str, new_password: str):
         user = self.db.find_one('users', {'_id': user_id})
-        if user and verify_password(old_password, user['password']):
+        if user and self.hasher.verify(old_password, user['password']):
             self.db.update_one(
                 'users',
                 {'_id': user_id},
-                {'$set': {'password': hash_password(new_password)}}
+                {'$set': {'password': self.hasher.hash(new_password)}}
             )
             return True
         return False
@@ -136,7 +141,7 @@ class AuthService:
             self.db.update_one(
                 'users',
                 {'_id': user_id},
-                {'$set': {'password': hash_password(new_password)}}
+                {'$set': {'password': self.hasher.hash(new_password)}}
             )
             return True
         except:
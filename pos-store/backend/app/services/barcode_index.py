@@ -0,0 +1,126 @@
+from app.services.product_service import PRODUCT_SERIALIZER, PRODUCTS_VERSION_ID
+from pymongo.errors import OperationFailure, PyMongoError
+from datetime import datetime, timedelta
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Mã lỗi khi server không hỗ trợ change stream (standalone / phiên bản cũ);
+# các OperationFailure khác là lỗi tạm thời và được thử lại
+CHANGE_STREAM_UNSUPPORTED = (40573, 40324)
+# Đọc lùi lại một đoạn khi polling để không lỡ bản ghi commit trễ hoặc lệch đồng hồ
+POLL_OVERLAP = timedelta(seconds=5)
+
+class BarcodeIndex:
+    """Bảng barcode -> sản phẩm trong bộ nhớ process.
+
+    Được nạp lúc khởi động và cập nhật từ change stream của collection products.
+    Nếu server không hỗ trợ change stream (standalone), chuyển sang polling các sản phẩm
+    có updated_at mới; version counter trong counters chỉ báo thao tác xoá (cần nạp lại toàn bộ).
+    """
+
+    def __init__(self, db, poll_interval: float = 5, retry_interval: float = 5):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self._records = {}
+        self._barcodes_by_id = {}
+        self._lock = threading.Lock()
+        self._version = None
+        self._since = None  # updated_at lớn nhất đã nạp (chế độ polling)
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='barcode-index', daemon=True)
+            self._thread.start()
+        return self
+
+    def get(self, barcode):
+        record = self._records.get(barcode)
+        return dict(record) if record is not None else None
+
+    def warm(self):
+        """Nạp lại toàn bộ bảng barcode từ database"""
+        version = self._read_version()
+        records = {}
+        barcodes_by_id = {}
+        since = None
+        for product in self.db.products.find({'barcode': {'$ne': None}}, PRODUCT_SERIALIZER.projection):
+            records[product['barcode']] = PRODUCT_SERIALIZER.serialize(product)
+            barcodes_by_id[product['_id']] = product['barcode']
+            if product.get('updated_at') and (since is None or product['updated_at'] > since):
+                since = product['updated_at']
+
+        with self._lock:
+            self._records = records
+            self._barcodes_by_id = barcodes_by_id
+            self._version = version
+            # Chưa sản phẩm nào có updated_at: chỉ đọc thay đổi từ bây giờ
+            self._since = since or datetime.utcnow()
+        logger.info(f"Barcode index warmed with {len(records)} products")
+
+    def _run(self):
+        while True:
+            try:
+                self._watch()
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_UNSUPPORTED:
+                    # Standalone server không có change stream
+                    logger.warning(f"Change streams unavailable ({str(e)}), polling products")
+                    self._poll()
+                    return
+                logger.error(f"Barcode index change stream failed: {str(e)}")
+                time.sleep(self.retry_interval)
+            except PyMongoError as e:
+                logger.error(f"Barcode index change stream failed: {str(e)}")
+                time.sleep(self.retry_interval)
+
+    def _watch(self):
+        # Mở stream trước khi nạp để không bỏ sót thay đổi xảy ra trong lúc nạp
+        with self.db.products.watch(full_document='updateLookup') as stream:
+            self.warm()
+            for change in stream:
+                self._apply_change(change)
+
+    def _poll(self):
+        while True:
+            try:
+                if self._version is None or self._read_version() != self._version:
+                    self.warm()
+                else:
+                    self._poll_updates()
+            except PyMongoError as e:
+                logger.error(f"Barcode index polling failed: {str(e)}")
+            time.sleep(self.poll_interval)
+
+    def _poll_updates(self):
+        """Chỉ nạp các sản phẩm đổi từ lần trước (index trên updated_at)"""
+        query = {'updated_at': {'$gte': self._since - POLL_OVERLAP}}
+        for product in self.db.products.find(query, PRODUCT_SERIALIZER.projection).sort('updated_at', 1):
+            self._apply_product(product['_id'], product)
+            self._since = max(self._since, product['updated_at'])
+
+    def _read_version(self):
+        counter = self.db.counters.find_one({'_id': PRODUCTS_VERSION_ID})
+        return counter['seq'] if counter else 0
+
+    def _apply_change(self, change):
+        operation = change['operationType']
+        if operation in ('drop', 'rename', 'dropDatabase', 'invalidate'):
+            self.warm()
+            return
+
+        product_id = change['documentKey']['_id']
+        self._apply_product(product_id, change.get('fullDocument') if operation != 'delete' else None)
+
+    def _apply_product(self, product_id, product):
+        with self._lock:
+            old_barcode = self._barcodes_by_id.pop(product_id, None)
+            if old_barcode is not None:
+                self._records.pop(old_barcode, None)
+            if product and product.get('barcode'):
+                self._records[product['barcode']] = PRODUCT_SERIALIZER.serialize(product)
+                self._barcodes_by_id[product_id] = product['barcode']
@@ -1,14 +1,139 @@
 import redis
 import json
 import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
 from typing import Any, Optional
 from datetime import timedelta
+from .cache_codec import CacheCodec
+
+KEY_PREFIX = 'pos'
+# Tăng khi thay đổi cấu trúc dữ liệu được cache để bỏ qua các key cũ
+SCHEMA_VERSION = 3
+INVALIDATION_CHANNEL = f'{KEY_PREFIX}:cache:invalidate'
+CLEAR_BATCH_SIZE = 500
+
+# Đọc generation của namespace và giá trị của key ở generation đó trong một round trip
+_GET_GENERATION_SCRIPT = """
+local generation = redis.call('GET', KEYS[1]) or '0'
+return {generation, redis.call('GET', ARGV[1] .. generation .. ARGV[2])}
+"""
+
+# Chỉ xoá lock nếu vẫn do chính mình giữ
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class LocalCache:
+    """Cache LRU/TTL trong process, giới hạn theo số entry và tổng số byte.
+
+    CacheService lưu bytes đã encode và decode mỗi lần đọc, nên caller sửa kết quả
+    không làm thay đổi entry dùng chung.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Trả về (found, value)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, key: str, value: Any, size: int, ttl: int = None):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + min(ttl or self.ttl, self.ttl), value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def get_stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses
+        }
 
 class CacheService:
     def __init__(self, config):
         self.config = config
         self.redis = self._connect()
         self.default_ttl = config.get('CACHE_TTL', 3600)  # 1 hour default
+        self.codec = CacheCodec(
+            config.get('CACHE_CODEC', 'msgpack'),
+            compress_threshold=config.get('CACHE_COMPRESS_THRESHOLD', 1024)
+        )
+        self.hits = Counter()
+        self.misses = Counter()
+        self._get_generation = self.redis.register_script(_GET_GENERATION_SCRIPT)
+        self._release_lock = self.redis.register_script(_RELEASE_LOCK_SCRIPT)
+
+        # Single-flight: mỗi key chỉ một loader chạy tại một thời điểm
+        self.stale_ttl = config.get('CACHE_STALE_TTL', 60)
+        self.lock_timeout = config.get('CACHE_LOCK_TIMEOUT', 5)
+        self.early_refresh_beta = config.get('CACHE_EARLY_REFRESH_BETA', 1.0)
+        self._flights = {}  # key -> [threading.Lock, số thread đang dùng]
+        self._flights_lock = threading.Lock()
+
+        # L1 trong process (tắt khi CACHE_L1_MAX_ENTRIES = 0)
+        self.instance_id = uuid.uuid4().hex
+        self.local = None
+        # Tăng mỗi lần xoá L1; giá trị đọc từ Redis trước lần xoá không được ghi vào L1
+        self._local_epoch = 0
+        self._local_epoch_lock = threading.Lock()
+        if config.get('CACHE_L1_MAX_ENTRIES', 0) > 0:
+            self.local = LocalCache(
+                max_entries=config['CACHE_L1_MAX_ENTRIES'],
+                max_bytes=config.get('CACHE_L1_MAX_BYTES', 16 * 1024 * 1024),
+                ttl=config.get('CACHE_L1_TTL', 30)
+            )
+            self._start_invalidation_listener()
 
     def _connect(self) -> redis.Redis:
         try:
@@ -17,7 +142,7 @@ class CacheService:
                 port=self.config['REDIS_PORT'],
                 password=self.config.get('REDIS_PASSWORD'),
                 db=self.config.get('REDIS_DB', 0),
-                decode_responses=True
+                decode_responses=False  # giá trị cache là bytes nhị phân (xem CacheCodec)
             )
             client.ping()
             logging.info("Connected to Redis successfully")
@@ -27,28 +152,42 @@ class CacheService:
             raise
 
     def get(self, key: str) -> Optional[Any]:
+        if self.local is not None:
+            found, data = self.local.get(key)
+            if found:
+                return self.codec.decode(data)
         try:
             data = self.redis.get(key)
-            return json.loads(data) if data else None
+            value = self.codec.decode(data) if data else None
+            if value is not None and self.local is not None:
+                self.local.set(key, data, len(data))
+            return value
         except Exception as e:
             logging.error(f"Cache get failed: {str(e)}")
             return None
 
     def set(self, key: str, value: Any, ttl: int = None) -> bool:
         try:
-            serialized = json.dumps(value)
-            return self.redis.set(
-                key,
-                serialized,
-                ex=ttl or self.default_ttl
-            )
+            serialized = self.codec.encode(value)
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.set(key, serialized, ex=ttl or self.default_ttl)
+            self._publish_invalidation(pipeline, keys=[key])
+            result = pipeline.execute()[0]
+            if self.local is not None:
+                self.local.set(key, serialized, len(serialized), ttl)
+            return result
         except Exception as e:
             logging.error(f"Cache set failed: {str(e)}")
             return False
 
     def delete(self, key: str) -> bool:
         try:
-            return bool(self.redis.delete(key))
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.delete(key)
+            self._publish_invalidation(pipeline, keys=[key])
+            if self.local is not None:
+                self.local.delete(key)
+            return bool(pipeline.execute()[0])
         except Exception as e:
             logging.error(f"Cache delete failed: {str(e)}")
             return False
@@ -62,18 +201,29 @@ class CacheService:
 
     def clear(self, pattern: str = None) -> bool:
         try:
+            self._clear_local(pattern)
             if pattern:
-                keys = self.redis.keys(pattern)
-                if keys:
-                    return bool(self.redis.delete(*keys))
+                # SCAN từng phần + UNLINK theo lô thay cho KEYS + DEL (chặn cả Redis server)
+                batch = []
+                for key in self.redis.scan_iter(match=pattern, count=1000):
+                    batch.append(key)
+                    if len(batch) >= CLEAR_BATCH_SIZE:
+                        self.redis.unlink(*batch)
+                        batch = []
+                if batch:
+                    self.redis.unlink(*batch)
+                self._publish_invalidation(self.redis, pattern=pattern)
                 return True
-            return bool(self.redis.flushdb())
+            result = bool(self.redis.flushdb(asynchronous=True))
+            self._publish_invalidation(self.redis, pattern='*')
+            return result
         except Exception as e:
             logging.error(f"Cache clear failed: {str(e)}")
             return False
 
     def increment(self, key: str, amount: int = 1) -> Optional[int]:
         try:
+            # Bộ đếm luôn đọc/ghi thẳng Redis, không đi qua L1
             return self.redis.incrby(key, amount)
         except Exception as e:
             logging.error(f"Cache increment failed: {str(e)}")
@@ -89,30 +239,321 @@ class CacheService:
     def set_many(self, mapping: dict, ttl: int = None) -> bool:
         try:
             pipeline = self.redis.pipeline()
-            for key, value in mapping.items():
-                pipeline.set(key, json.dumps(value), ex=ttl or self.default_ttl)
+            serialized = {key: self.codec.encode(value) for key, value in mapping.items()}
+            for key, data in serialized.items():
+                pipeline.set(key, data, ex=ttl or self.default_ttl)
+            self._publish_invalidation(pipeline, keys=list(mapping))
             pipeline.execute()
+            if self.local is not None:
+                for key, data in serialized.items():
+                    self.local.set(key, data, len(data), ttl)
             return True
         except Exception as e:
             logging.error(f"Cache set_many failed: {str(e)}")
             return False
 
     def get_many(self, keys: list) -> dict:
+        result = {}
+        missing = keys
+        if self.local is not None:
+            missing = []
+            for key in keys:
+                found, data = self.local.get(key)
+                if found:
+                    result[key] = self.codec.decode(data)
+                else:
+                    missing.append(key)
+        if not missing:
+            return result
+
         try:
+            # Chỉ pipeline các key không có trong L1
             pipeline = self.redis.pipeline()
-            for key in keys:
+            for key in missing:
                 pipeline.get(key)
-            values = pipeline.execute()
-            return {
-                key: json.loads(value) if value else None
-                for key, value in zip(keys, values)
-            }
+            for key, data in zip(missing, pipeline.execute()):
+                value = self.codec.decode(data) if data else None
+                if value is not None and self.local is not None:
+                    self.local.set(key, data, len(data))
+                result[key] = value
+            return result
         except Exception as e:
             logging.error(f"Cache get_many failed: {str(e)}")
-            return {}
+            return result
+
+    def make_key(self, namespace: str, *parts) -> str:
+        return ':'.join([KEY_PREFIX, f'v{SCHEMA_VERSION}', namespace, *(str(part) for part in parts)])
+
+    def _generation_key(self, namespace: str) -> str:
+        return self.make_key(namespace, 'generation')
+
+    def _split_namespaced_key(self, namespace: str, parts) -> tuple:
+        # Key thực trong Redis: pos:v1:<namespace>:g<generation>:<parts>
+        return self.make_key(namespace, 'g'), ':' + ':'.join(str(part) for part in parts)
+
+    def get_namespaced(self, namespace: str, parts) -> tuple:
+        """Đọc key thuộc namespace theo generation hiện tại, trả về (value, generation)"""
+        key = self.make_key(namespace, *parts)
+        if self.local is not None:
+            found, data = self.local.get(key)
+            if found:
+                return self.codec.decode(data), None
+        try:
+            epoch = self._local_epoch
+            prefix, suffix = self._split_namespaced_key(namespace, parts)
+            generation, data = self._get_generation(keys=[self._generation_key(namespace)], args=[prefix, suffix])
+            generation = int(generation)
+            value = self.codec.decode(data) if data else None
+            if value is not None:
+                self._set_local_since(epoch, key, data)
+            return value, generation
+        except Exception as e:
+            logging.error(f"Cache get failed: {str(e)}")
+            return None, None
+
+    def set_namespaced(self, namespace: str, parts, value: Any, generation, ttl: int = None) -> bool:
+        """Ghi key vào đúng generation đã đọc; nếu namespace vừa bị invalidate thì key mới tự hết hạn"""
+        if generation is None:
+            return False
+        try:
+            epoch = self._local_epoch
+            prefix, suffix = self._split_namespaced_key(namespace, parts)
+            serialized = self.codec.encode(value)
+            result = self.redis.set(f'{prefix}{generation}{suffix}', serialized, ex=ttl or self.default_ttl)
+            # Generation cũ (namespace đã bị invalidate sau khi đọc) thì chỉ để key trong Redis tự hết hạn
+            if self.local is not None and generation == self._current_generation(namespace):
+                self._set_local_since(epoch, self.make_key(namespace, *parts), serialized, ttl)
+            return result
+        except Exception as e:
+            logging.error(f"Cache set failed: {str(e)}")
+            return False
+
+    def invalidate(self, namespace: str) -> bool:
+        """Xoá toàn bộ key thuộc một namespace trong O(1) bằng cách tăng generation"""
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.incr(self._generation_key(namespace))
+            self._publish_invalidation(pipeline, pattern=self.make_key(namespace, '*'))
+            pipeline.execute()
+            self._clear_local(self.make_key(namespace, '*'))
+            return True
+        except Exception as e:
+            logging.error(f"Cache invalidate failed: {str(e)}")
+            return False
+
+    def get_or_load(self, namespace: str, parts, loader, ttl: int = None):
+        """Read-through có single-flight, stale-while-revalidate và làm mới sớm (XFetch).
+
+        Giá trị được lưu kèm hạn mềm và thời gian load; sau hạn mềm key còn sống thêm
+        stale_ttl giây để trả dữ liệu cũ trong lúc một loader duy nhất làm mới.
+        """
+        ttl = ttl or self.default_ttl
+        key = self.make_key(namespace, *parts)
+        entry, generation = self.get_namespaced(namespace, parts)
+
+        if entry is not None:
+            if not self._should_refresh(entry):
+                self.record(namespace, hit=True)
+                return entry['value']
+            # Hết hạn mềm (hoặc làm mới sớm): chỉ một caller load lại, các caller khác nhận giá trị cũ
+            with self._local_flight(key, blocking=False) as acquired:
+                if acquired:
+                    token = self._acquire_lock(key)
+                    if token:
+                        self.record(namespace, hit=False)
+                        return self._load(namespace, parts, loader, ttl, generation, key, token)
+            self.record(namespace, hit=True)
+            return entry['value']
+
+        with self._local_flight(key, blocking=True):
+            # Thread khác trong process có thể vừa load xong
+            entry, generation = self.get_namespaced(namespace, parts)
+            if entry is not None:
+                self.record(namespace, hit=True)
+                return entry['value']
+
+            token = self._acquire_lock(key)
+            deadline = time.monotonic() + self.lock_timeout
+            while not token and time.monotonic() < deadline:
+                # Worker khác đang load: chờ kết quả thay vì cùng truy vấn database
+                time.sleep(0.05)
+                entry, generation = self.get_namespaced(namespace, parts)
+                if entry is not None:
+                    self.record(namespace, hit=True)
+                    return entry['value']
+                token = self._acquire_lock(key)
+            self.record(namespace, hit=False)
+            return self._load(namespace, parts, loader, ttl, generation, key, token)
+
+    def _load(self, namespace: str, parts, loader, ttl: int, generation, key: str, token):
+        try:
+            started = time.monotonic()
+            value = loader()
+            if value is not None:
+                if generation is None:
+                    generation = self._current_generation(namespace)
+                entry = {
+                    'value': value,
+                    'soft_expiry': time.time() + ttl,
+                    'delta': time.monotonic() - started
+                }
+                self.set_namespaced(namespace, parts, entry, generation, ttl + self.stale_ttl)
+            return value
+        finally:
+            if token:
+                self._unlock(key, token)
+
+    def _should_refresh(self, entry: dict) -> bool:
+        # XFetch: xác suất làm mới tăng dần khi gần hết hạn, tỉ lệ với thời gian load
+        early = entry['delta'] * self.early_refresh_beta * -math.log(1.0 - random.random())
+        return time.time() + early >= entry['soft_expiry']
+
+    @contextmanager
+    def _local_flight(self, key: str, blocking: bool):
+        with self._flights_lock:
+            flight = self._flights.setdefault(key, [threading.Lock(), 0])
+            flight[1] += 1
+        acquired = flight[0].acquire(blocking, self.lock_timeout if blocking else -1)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                flight[0].release()
+            with self._flights_lock:
+                flight[1] -= 1
+                if not flight[1]:
+                    self._flights.pop(key, None)
+
+    def _acquire_lock(self, key: str):
+        """Lock Redis ngắn giữa các worker; trả về token, hoặc True khi Redis lỗi (cho phép load)"""
+        token = uuid.uuid4().hex
+        try:
+            if self.redis.set(f'{key}:lock', token, nx=True, px=int(self.lock_timeout * 1000)):
+                return token
+            return None
+        except Exception as e:
+            logging.error(f"Cache lock failed: {str(e)}")
+            return True
+
+    def _unlock(self, key: str, token):
+        if token is True:
+            return
+        try:
+            self._release_lock(keys=[f'{key}:lock'], args=[token])
+        except Exception as e:
+            logging.error(f"Cache unlock failed: {str(e)}")
+
+    def _current_generation(self, namespace: str):
+        try:
+            return int(self.redis.get(self._generation_key(namespace)) or 0)
+        except Exception as e:
+            logging.error(f"Cache generation read failed: {str(e)}")
+            return None
+
+    def record(self, namespace: str, hit: bool):
+        (self.hits if hit else self.misses)[namespace] += 1
+
+    def get_stats(self) -> dict:
+        namespaces = sorted(set(self.hits) | set(self.misses))
+        stats = {
+            namespace: {
+                'hits': self.hits[namespace],
+                'misses': self.misses[namespace],
+                'hit_rate': self.hits[namespace] / ((self.hits[namespace] + self.misses[namespace]) or 1)
+            }
+            for namespace in namespaces
+        }
+        if self.local is not None:
+            stats['l1'] = self.local.get_stats()
+        return stats
+
+    def _clear_local(self, pattern: str = None):
+        if self.local is None:
+            return
+        prefix = (pattern or '*')[:-1]
+        with self._local_epoch_lock:
+            self._local_epoch += 1
+            if pattern and pattern.endswith('*') and not any(ch in prefix for ch in '*?['):
+                self.local.delete_prefix(prefix)
+            else:
+                self.local.clear()
+
+    def _set_local_since(self, epoch: int, key: str, data: bytes, ttl: int = None):
+        # Bỏ qua nếu L1 đã bị xoá kể từ lúc đọc epoch (giá trị có thể thuộc generation cũ)
+        if self.local is None:
+            return
+        with self._local_epoch_lock:
+            if self._local_epoch == epoch:
+                self.local.set(key, data, len(data), ttl)
+
+    def _publish_invalidation(self, client, keys: list = None, pattern: str = None):
+        # Báo cho các worker khác xoá L1; chỉ cần khi L1 được bật
+        if self.local is None:
+            return
+        message = json.dumps({'origin': self.instance_id, 'keys': keys or [], 'pattern': pattern})
+        client.publish(INVALIDATION_CHANNEL, message)
+
+    def _start_invalidation_listener(self):
+        thread = threading.Thread(target=self._listen_invalidations, name='cache-invalidation', daemon=True)
+        thread.start()
+
+    def _listen_invalidations(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Có thể đã lỡ message trong lúc mất kết nối
+                self._clear_local()
+                for message in pubsub.listen():
+                    data = json.loads(message['data'])
+                    if data['origin'] == self.instance_id:
+                        continue
+                    for key in data['keys']:
+                        self.local.delete(key)
+                    if data['pattern']:
+                        self._clear_local(data['pattern'])
+            except Exception as e:
+                logging.error(f"Cache invalidation listener failed: {str(e)}")
+                time.sleep(1)
 
     def close(self):
         try:
             self.redis.close()
         except Exception as e:
             logging.error(f"Redis connection close failed: {str(e)}")
+
+
+def _cache_key_parts(fn, args, kwargs):
+    return [fn.__name__, *args, *(f'{key}={value}' for key, value in sorted(kwargs.items()))]
+
+def cached(namespace: str, ttl: int = None):
+    """Read-through cache cho method của service (dùng self.cache, bỏ qua nếu không có cache).
+
+    Miss được gom qua CacheService.get_or_load nên mỗi key chỉ có một lần truy vấn database.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            cache = getattr(self, 'cache', None)
+            if cache is None:
+                return fn(self, *args, **kwargs)
+
+            parts = _cache_key_parts(fn, args, kwargs)
+            return cache.get_or_load(namespace, parts, lambda: fn(self, *args, **kwargs), ttl)
+        return wrapper
+    return decorator
+
+def invalidates(*namespaces: str):
+    """Xoá cache của các namespace sau khi method ghi dữ liệu chạy xong"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                cache = getattr(self, 'cache', None)
+                if cache is not None:
+                    for namespace in namespaces:
+                        cache.invalidate(namespace)
+        return wrapper
+    return decorator
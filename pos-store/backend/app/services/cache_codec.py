@@ -0,0 +1,107 @@
+from bson import ObjectId
+from datetime import datetime
+from decimal import Decimal
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # msgpack là tuỳ chọn, fallback về JSON có gắn kiểu
+    msgpack = None
+
+# Header 2 byte: [codec id][flags]. Đổi codec chỉ cần thêm id mới, payload cũ vẫn đọc được.
+FLAG_COMPRESSED = 0x01
+
+class JsonCodec:
+    """JSON gắn kiểu: ObjectId/datetime/Decimal được bọc trong object $oid/$date/$decimal"""
+    codec_id = 1
+
+    @staticmethod
+    def _default(value):
+        if isinstance(value, ObjectId):
+            return {'$oid': str(value)}
+        if isinstance(value, datetime):
+            return {'$date': value.isoformat()}
+        if isinstance(value, Decimal):
+            return {'$decimal': str(value)}
+        raise TypeError(f'Object of type {type(value).__name__} is not cacheable')
+
+    @staticmethod
+    def _object_hook(data):
+        if len(data) == 1:
+            if '$oid' in data:
+                return ObjectId(data['$oid'])
+            if '$date' in data:
+                return datetime.fromisoformat(data['$date'])
+            if '$decimal' in data:
+                return Decimal(data['$decimal'])
+        return data
+
+    def dumps(self, value) -> bytes:
+        return json.dumps(value, default=self._default, separators=(',', ':')).encode()
+
+    def loads(self, data: bytes):
+        return json.loads(data, object_hook=self._object_hook)
+
+class MsgpackCodec:
+    """msgpack nhị phân, ObjectId/datetime/Decimal dùng ExtType"""
+    codec_id = 2
+    EXT_OBJECT_ID = 1
+    EXT_DATETIME = 2
+    EXT_DECIMAL = 3
+
+    def _default(self, value):
+        if isinstance(value, ObjectId):
+            return msgpack.ExtType(self.EXT_OBJECT_ID, value.binary)
+        if isinstance(value, datetime):
+            return msgpack.ExtType(self.EXT_DATETIME, value.isoformat().encode())
+        if isinstance(value, Decimal):
+            return msgpack.ExtType(self.EXT_DECIMAL, str(value).encode())
+        raise TypeError(f'Object of type {type(value).__name__} is not cacheable')
+
+    def _ext_hook(self, code, data):
+        if code == self.EXT_OBJECT_ID:
+            return ObjectId(data)
+        if code == self.EXT_DATETIME:
+            return datetime.fromisoformat(data.decode())
+        if code == self.EXT_DECIMAL:
+            return Decimal(data.decode())
+        return msgpack.ExtType(code, data)
+
+    def dumps(self, value) -> bytes:
+        return msgpack.packb(value, default=self._default, use_bin_type=True)
+
+    def loads(self, data: bytes):
+        return msgpack.unpackb(data, ext_hook=self._ext_hook, raw=False, strict_map_key=False)
+
+class CacheCodec:
+    """Mã hoá giá trị cache: header phiên bản + payload, nén zlib khi vượt ngưỡng"""
+
+    def __init__(self, name: str = 'msgpack', compress_threshold: int = 1024, compress_level: int = 1):
+        self.codecs = {JsonCodec.codec_id: JsonCodec()}
+        if msgpack is not None:
+            self.codecs[MsgpackCodec.codec_id] = MsgpackCodec()
+
+        if name == 'msgpack' and msgpack is not None:
+            self.codec = self.codecs[MsgpackCodec.codec_id]
+        else:
+            self.codec = self.codecs[JsonCodec.codec_id]
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def encode(self, value) -> bytes:
+        payload = self.codec.dumps(value)
+        flags = 0
+        if self.compress_threshold and len(payload) > self.compress_threshold:
+            payload = zlib.compress(payload, self.compress_level)
+            flags |= FLAG_COMPRESSED
+        return bytes((self.codec.codec_id, flags)) + payload
+
+    def decode(self, data: bytes):
+        codec = self.codecs.get(data[0])
+        if codec is None:
+            raise ValueError(f'Unknown cache codec id: {data[0]}')
+        payload = data[2:]
+        if data[1] & FLAG_COMPRESSED:
+            payload = zlib.decompress(payload)
+        return codec.loads(payload)
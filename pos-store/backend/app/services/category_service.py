@@ -1,16 +1,66 @@
 from app.models.category import Category
 from datetime import datetime
-from bson import ObjectId, errors
+from bson import ObjectId
+from app.services.cache import cached, invalidates
+from collections import defaultdict
 import logging
+import queue
+import threading
+import time
 
 # Initialize logger
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Các trường cần cho cây danh mục, không tải timestamp
+TREE_FIELDS = {'name': 1, 'description': 1, 'icon': 1, 'color': 1, 'parent_id': 1, 'active': 1}
+
+def _active_flag(data, default):
+    """Giá trị active từ request; chỉ nhận boolean JSON ("false" hay null không được đoán nghĩa)"""
+    value = data.get('active', default)
+    if not isinstance(value, bool):
+        raise ValueError('active must be true or false')
+    return value
+
+class CategoryDiagnostics:
+    """Chẩn đoán truy vấn danh mục (bật bằng CATEGORY_DIAGNOSTICS), chạy trên một thread nền.
+
+    Request chỉ đẩy (id, thời gian, tìm thấy hay không) vào hàng đợi; thread nền ghi log và
+    khi không tìm thấy thì mới xem trạng thái collection. Hàng đợi đầy thì bỏ mẫu, không chặn request.
+    """
+
+    def __init__(self, db, max_pending=100):
+        self.db = db
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name='category-diagnostics', daemon=True)
+        self._thread.start()
+
+    def record(self, category_id, elapsed, found):
+        try:
+            self._queue.put_nowait((category_id, elapsed, found))
+        except queue.Full:
+            pass
+
+    def _run(self):
+        while True:
+            category_id, elapsed, found = self._queue.get()
+            try:
+                logger.debug(f"Category {category_id}: {elapsed * 1000:.2f}ms, found={found}")
+                if not found:
+                    count = self.db.categories.count_documents({})
+                    sample = [str(doc['_id']) for doc in self.db.categories.find({}, {'_id': 1}).limit(2)]
+                    logger.debug(f"Category {category_id} not found; {count} categories, sample ids: {sample}")
+            except Exception as e:
+                logger.error(f"Category diagnostics failed: {str(e)}")
+
 class CategoryService:
-    def __init__(self, db):
+    def __init__(self, db, cache=None, diagnostics=None):
         self.db = db
+        self.cache = cache
+        # CategoryDiagnostics dùng chung trong process (create_app tạo khi bật CATEGORY_DIAGNOSTICS)
+        self.diagnostics = diagnostics
 
+    @cached('categories')
     def get_categories(self, search=None, page=1, limit=20):
         logger.debug(f"Getting categories with search={search}, page={page}, limit={limit}")
         query = {}
@@ -34,6 +84,7 @@ class CategoryService:
                 'icon': cat.get('icon'),
                 'color': cat.get('color'),
                 'parent_id': str(cat['parent_id']) if cat.get('parent_id') else None,
+                'active': cat.get('active', True),
                 'created_at': cat['created_at'].isoformat() if cat.get('created_at') else None,
                 'updated_at': cat['updated_at'].isoformat() if cat.get('updated_at') else None
             }
@@ -51,37 +102,27 @@ class CategoryService:
         return result
     
     def get_category(self, category_id):
-        try:
-            # Kiểm tra collection và document trực tiếp
-            logger.debug(f"Collections hiện có: {self.db.list_collection_names()}")
-            
-            # Đếm số lượng documents trong collection categories
-            count = self.db.categories.count_documents({})
-            logger.debug(f"Tổng số categories: {count}")
-            
-            # Lấy một vài document mẫu
-            sample = list(self.db.categories.find().limit(2))
-            logger.debug(f"Mẫu documents: {sample}")
-            
-            # Thực hiện truy vấn chính
-            category = self.db.categories.find_one({'_id': ObjectId(category_id)})
-            
-            if category:
-                category['_id'] = str(category['_id'])
-                if category.get('parent_id'):
-                    category['parent_id'] = str(category['parent_id'])
-                # Chuyển đổi datetime sang string
-                if category.get('created_at'):
-                    category['created_at'] = category['created_at'].isoformat()
-                if category.get('updated_at'):
-                    category['updated_at'] = category['updated_at'].isoformat()
-                return category
-            return None
-            
-        except Exception as e:
-            logger.error(f"Lỗi truy vấn: {str(e)}")
+        if not ObjectId.is_valid(category_id):
             return None
+
+        started = time.perf_counter()
+        category = self.db.categories.find_one({'_id': ObjectId(category_id)})
+        if self.diagnostics is not None:
+            self.diagnostics.record(category_id, time.perf_counter() - started, category is not None)
+
+        if category:
+            category['_id'] = str(category['_id'])
+            if category.get('parent_id'):
+                category['parent_id'] = str(category['parent_id'])
+            # Chuyển đổi datetime sang string
+            if category.get('created_at'):
+                category['created_at'] = category['created_at'].isoformat()
+            if category.get('updated_at'):
+                category['updated_at'] = category['updated_at'].isoformat()
+            return category
+        return None
         
+    @invalidates('categories')
     def create_category(self, data):
         # Kiểm tra xem category name đã tồn tại chưa
         existing_category = self.db.categories.find_one({'name': data['name']})
@@ -93,7 +134,8 @@ class CategoryService:
             description=data.get('description'),
             icon=data.get('icon'),
             color=data.get('color'),
-            parent_id=ObjectId(data['parent_id']) if data.get('parent_id') else None
+            parent_id=ObjectId(data['parent_id']) if data.get('parent_id') else None,
+            active=_active_flag(data, True)
         )
         
         # Đảm bảo _id luôn là ObjectId
@@ -102,6 +144,7 @@ class CategoryService:
         
         return category
 
+    @invalidates('categories')
     def update_category(self, category_id: str, data: dict):
         category = self.db.categories.find_one({'_id': ObjectId(category_id)})
         if not category:
@@ -122,6 +165,7 @@ class CategoryService:
             'icon': data.get('icon', category.get('icon')),
             'color': data.get('color', category.get('color')),
             'parent_id': ObjectId(data['parent_id']) if data.get('parent_id') else category.get('parent_id'),
+            'active': _active_flag(data, category.get('active', True)),
             'updated_at': current_time
         }
 
@@ -138,6 +182,7 @@ class CategoryService:
         
         return response_data
 
+    @invalidates('categories')
     def delete_category(self, category_id: str):
         # Kiểm tra xem category có đang được sử dụng trong products không
         if self.db.products.find_one({'category_id': ObjectId(category_id)}):
@@ -147,20 +192,56 @@ class CategoryService:
         result = self.db.categories.delete_one({'_id': ObjectId(category_id)})
         return bool(result.deleted_count)
 
-    def get_category_tree(self):
-        categories = self.db.find_many('categories', {'parent_id': None})
-        
-        def get_children(parent_id):
-            children = self.db.find_many('categories', {'parent_id': parent_id})
-            for child in children:
-                child['children'] = get_children(child['_id'])
-            return children
-        
-        for category in categories:
-            category['children'] = get_children(category['_id'])
-        
-        return categories
-    
-    def get_all_category_ids(self):
-        categories = self.db.categories.find({}, {'_id': 1})
-        return [str(category['_id']) for category in categories]
+    @cached('categories')
+    def get_category_tree(self, active=None, parent_id=None, depth=None):
+        """Cây danh mục dựng từ một truy vấn duy nhất, O(n) trong bộ nhớ.
+
+        active: chỉ giữ danh mục có trạng thái tương ứng (danh mục bị loại kéo theo cả nhánh con).
+        parent_id: trả về cây con dưới danh mục này, None nếu không tồn tại.
+        depth: số tầng tối đa (1 = chỉ các danh mục gốc), None là không giới hạn.
+        """
+        nodes = {}
+        children = defaultdict(list)
+        for category in self.db.categories.find({}, TREE_FIELDS).sort('name', 1):
+            nodes[category['_id']] = {
+                '_id': str(category['_id']),
+                'name': category.get('name'),
+                'description': category.get('description'),
+                'icon': category.get('icon'),
+                'color': category.get('color'),
+                'parent_id': str(category['parent_id']) if category.get('parent_id') else None,
+                # Danh mục tạo trước khi có trường active được coi là đang hoạt động
+                'active': category.get('active', True)
+            }
+            children[category.get('parent_id')].append(category['_id'])
+
+        if parent_id is not None:
+            root_id = ObjectId(parent_id)
+            if root_id not in nodes:
+                return None
+            roots = children.get(root_id, [])
+        else:
+            # parent_id trỏ tới danh mục đã xoá thì đưa lên làm gốc thay vì làm mất cả nhánh
+            roots = [node_id for parent, ids in children.items() if parent is None or parent not in nodes
+                     for node_id in ids]
+
+        def visible(node_id):
+            return active is None or nodes[node_id]['active'] == active
+
+        tree = [nodes[node_id] for node_id in roots if visible(node_id)]
+        level = [(node_id, nodes[node_id]) for node_id in roots if visible(node_id)]
+        current_depth = 1
+        while level:
+            expand = depth is None or current_depth < depth
+            next_level = []
+            for node_id, node in level:
+                node['children'] = []
+                if not expand:
+                    continue
+                for child_id in children.get(node_id, []):
+                    if visible(child_id):
+                        node['children'].append(nodes[child_id])
+                        next_level.append((child_id, nodes[child_id]))
+            level = next_level
+            current_depth += 1
+        return tree
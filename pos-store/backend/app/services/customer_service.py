@@ -1,9 +1,13 @@
 from app.models.customers import Customer
 from app.utils.query_utils import build_search_query
 from app.utils.pagination_utils import paginate_results
+from app.utils.index_utils import declare_index, declare_query
 from datetime import datetime
 from bson import ObjectId
 
+declare_index('customers', 'phone', unique=True)
+declare_query('by_phone', 'customers', {'phone': ''})
+
 class CustomerService:
     def __init__(self, db_service):
         self.db = db_service
@@ -0,0 +1,102 @@
+from collections import deque
+import logging
+import math
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'pos:login'
+
+# Sliding window trên sorted set (score = thời điểm, ms). Kiểm tra mọi key trước rồi mới ghi,
+# nên lần thử bị từ chối không được tính và không key nào bị ghi dở.
+# Trả về 0 nếu được phép, ngược lại là số ms phải chờ.
+_SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= tonumber(ARGV[3 + i]) then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        return math.max(1, tonumber(oldest[2]) + window - now)
+    end
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[3])
+    redis.call('PEXPIRE', key, window)
+end
+return 0
+"""
+
+class LoginRateLimiter:
+    """Giới hạn số lần đăng nhập trong cửa sổ trượt, theo IP và theo email.
+
+    Đếm bằng Lua script trên Redis để mọi worker dùng chung; Redis lỗi thì chuyển sang
+    bộ đếm trong process (mỗi worker một bộ đếm riêng) thay vì bỏ giới hạn.
+    """
+
+    def __init__(self, redis=None, window: int = 300, ip_limit: int = 50, email_limit: int = 10,
+                 max_local_keys: int = 100000):
+        self.redis = redis
+        self.window_ms = window * 1000
+        self.ip_limit = ip_limit
+        self.email_limit = email_limit
+        self.max_local_keys = max_local_keys
+        self._script = redis.register_script(_SLIDING_WINDOW_SCRIPT) if redis is not None else None
+        self._local = {}  # key -> deque thời điểm (ms)
+        self._lock = threading.Lock()
+
+    def hit(self, ip: str, email: str) -> float:
+        """Ghi nhận một lần thử; trả về 0 nếu được phép, ngược lại là số giây phải chờ.
+
+        Giới hạn bằng 0 là tắt bộ đếm tương ứng.
+        """
+        buckets = [(f'{KEY_PREFIX}:ip:{ip}', self.ip_limit),
+                   (f'{KEY_PREFIX}:email:{email.strip().lower()}', self.email_limit)]
+        buckets = [(key, limit) for key, limit in buckets if limit > 0]
+        if not buckets:
+            return 0
+        keys = [key for key, _ in buckets]
+        limits = [limit for _, limit in buckets]
+        now = int(time.time() * 1000)
+        if self._script is not None:
+            try:
+                wait = self._script(keys=keys, args=[now, self.window_ms, uuid.uuid4().hex, *limits])
+                return math.ceil(int(wait) / 1000)
+            except Exception as e:
+                logger.error(f"Login rate limiter fell back to local counters: {str(e)}")
+        return math.ceil(self._local_hit(keys, limits, now) / 1000)
+
+    def reset(self, email: str):
+        """Đăng nhập thành công thì xoá bộ đếm theo email (bộ đếm theo IP giữ nguyên)"""
+        key = f'{KEY_PREFIX}:email:{email.strip().lower()}'
+        with self._lock:
+            self._local.pop(key, None)
+        if self.redis is not None:
+            try:
+                self.redis.delete(key)
+            except Exception as e:
+                logger.error(f"Resetting login rate limit failed: {str(e)}")
+
+    def _local_hit(self, keys: list, limits: list, now: int) -> int:
+        start = now - self.window_ms
+        with self._lock:
+            for key, limit in zip(keys, limits):
+                attempts = self._local.get(key)
+                if attempts is None:
+                    continue
+                while attempts and attempts[0] <= start:
+                    attempts.popleft()
+                if len(attempts) >= limit:
+                    return max(1, attempts[0] + self.window_ms - now)
+            if len(self._local) >= self.max_local_keys:
+                self._prune(start)
+            for key in keys:
+                self._local.setdefault(key, deque()).append(now)
+        return 0
+
+    def _prune(self, start: int):
+        # Bỏ các key đã ra khỏi cửa sổ để bộ nhớ không tăng theo số IP/email lạ
+        for key in [key for key, attempts in self._local.items() if not attempts or attempts[-1] <= start]:
+            del self._local[key]
@@ -1,24 +1,88 @@
 from flask_mail import Message
 from flask import current_app
+from jinja2 import Environment
+import threading
+import time
+
+# Template được compile một lần khi import, mỗi email chỉ còn bước render
+_templates = Environment(autoescape=True)
+VERIFICATION_TEMPLATE = _templates.from_string('''
+    <h1>Xác thực tài khoản</h1>
+    <p>Click vào link sau để xác thực email của bạn:</p>
+    <a href="{{ verify_url }}">Xác thực ngay</a>
+''')
 
 class MailService:
-    def __init__(self, mail):
+    """Gửi mail đồng bộ trên kết nối SMTP giữ theo thread.
+
+    Email được giao qua outbox (handler không transactional): lỗi SMTP được raise để outbox
+    retry có backoff, receipt chỉ ghi sau khi server nhận thư nên không mất email khi restart.
+    """
+
+    def __init__(self, mail, idle_timeout=5):
         self.mail = mail
+        self.idle_timeout = idle_timeout
+        self._local = threading.local()  # kết nối SMTP của từng thread gọi send()
 
     def send_verification_email(self, email, token):
-        subject = 'Xác thực tài khoản'
-        sender = current_app.config['MAIL_USERNAME']
+        """Gửi đồng bộ, lỗi thì raise: gọi từ outbox worker để outbox retry tới khi gửi được"""
         verify_url = f'{current_app.config["HOSTNAME"]}/api/auth/verify-email/{token}'
-    
-        msg = Message(
-            subject,
-            sender=sender,
-            recipients=[email],
-            html=f'''
-                <h1>Xác thực tài khoản</h1>
-                <p>Click vào link sau để xác thực email của bạn:</p>
-                <a href="{verify_url}">Xác thực ngay</a>
-            '''
+        self.send('Xác thực tài khoản', [email], VERIFICATION_TEMPLATE.render(verify_url=verify_url))
+
+    def send(self, subject, recipients, html):
+        """Gửi ngay trên kết nối SMTP giữ theo thread; raise nếu server không nhận thư"""
+        message = self._build_message({
+            'subject': subject,
+            'sender': current_app.config['MAIL_USERNAME'],
+            'recipients': recipients,
+            'html': html
+        })
+        reused = self._local_connection_alive()
+        try:
+            self._local_connection().send(message)
+        except Exception:
+            self._close_local_connection()
+            if not reused:
+                raise
+            # Kết nối cũ có thể đã bị server đóng: thử lại một lần trên kết nối mới
+            try:
+                self._local_connection().send(message)
+            except Exception:
+                self._close_local_connection()
+                raise
+        self._local.last_used = time.monotonic()
+
+    def _local_connection_alive(self) -> bool:
+        if getattr(self._local, 'connection', None) is None:
+            return False
+        if time.monotonic() - self._local.last_used > self.idle_timeout:
+            # Rảnh quá idle_timeout thì đóng, tránh giữ kết nối mà server sắp cắt
+            self._close_local_connection()
+            return False
+        return True
+
+    def _local_connection(self):
+        if getattr(self._local, 'connection', None) is None:
+            connection = self.mail.connect()
+            connection.__enter__()
+            self._local.connection = connection
+            self._local.last_used = time.monotonic()
+        return self._local.connection
+
+    def _close_local_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _build_message(message: dict) -> Message:
+        return Message(
+            message['subject'],
+            sender=message['sender'],
+            recipients=message['recipients'],
+            html=message['html']
         )
-        
-        self.mail.send(msg)
\ No newline at end of file
@@ -1,12 +1,139 @@
 from app.models.orders import Order, OrderItem
-from datetime import datetime
+from app.utils.transaction_utils import run_in_transaction
+from app.utils.order_utils import shared_order_number_generator
+from app.utils.serializer_utils import DocumentSerializer
+from app.utils.index_utils import declare_index, declare_query
+from app.services.report_service import SALES_STATUS
+from app.services.outbox import publish_event
+from app.services.outbox_handlers import ORDER_COMPLETED, ORDER_REVERSED, order_event_payload
+from app.services.cache import invalidates, LocalCache
+from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import UpdateOne, ReturnDocument
+import base64
+import json
+
+# Thứ tự ổn định cho cả phân trang theo page lẫn theo cursor
+ORDER_SORT = [('created_at', -1), ('_id', -1)]
+COUNT_MODES = ('exact', 'estimated', 'cached', 'none')
+COUNT_CACHE_TTL = 30  # giây
+COUNT_CACHE_MAX_ENTRIES = 1000  # số bộ lọc giữ tổng số, cũ nhất bị bỏ trước
+
+declare_index('orders', 'order_number', unique=True)
+declare_index('orders', ORDER_SORT)
+declare_index('orders', [('status', 1), ('created_at', -1), ('_id', -1)])
+declare_index('orders', [('customer_id', 1), ('created_at', -1), ('_id', -1)])
+declare_query('by_number', 'orders', {'order_number': 'ORD'})
+declare_query('list', 'orders', {}, ORDER_SORT)
+declare_query('list_by_status', 'orders', {'status': 'completed'}, ORDER_SORT)
+declare_query('list_by_customer', 'orders', {'customer_id': ObjectId()}, ORDER_SORT)
+
+# Serializer dùng chung cho mọi response trả về đơn hàng
+ORDER_ITEM_SERIALIZER = DocumentSerializer(
+    ['product_id', 'name', 'price', 'quantity', 'discount', 'subtotal'],
+    defaults={'discount': 0}
+)
+ORDER_SERIALIZER = DocumentSerializer(
+    ['_id', 'order_number', 'customer_id', 'items', 'subtotal', 'tax', 'total',
+     'payment_method', 'status', 'notes', 'created_by', 'created_at', 'updated_at'],
+    nested={'items': ORDER_ITEM_SERIALIZER}
+)
+
+# Export: duyệt theo thứ tự tăng dần trên cùng index ORDER_SORT
+EXPORT_SORT = [('created_at', 1), ('_id', 1)]
+EXPORT_BATCH_SIZE = 2000
+EXPORT_FORMATS = ('ndjson', 'csv')
+# CSV: mỗi dòng là một item, thông tin đơn hàng lặp lại trên từng dòng
+ORDER_EXPORT_COLUMNS = [
+    'order_number', 'created_at', 'status', 'payment_method', 'customer_id', 'created_by',
+    'order_subtotal', 'tax', 'total', 'product_id', 'name', 'price', 'quantity', 'discount', 'subtotal'
+]
+
+def order_export_rows(order):
+    head = [order['order_number'], order['created_at'], order['status'], order['payment_method'],
+            order['customer_id'], order['created_by'], order['subtotal'], order['tax'], order['total']]
+    items = order['items'] or [{}]
+    return [head + [item.get('product_id'), item.get('name'), item.get('price'), item.get('quantity'),
+                    item.get('discount'), item.get('subtotal')] for item in items]
+
+def encode_order_cursor(order):
+    """Mã hoá vị trí (created_at, _id) thành cursor dạng chuỗi"""
+    raw = json.dumps([order['created_at'].isoformat(), str(order['_id'])])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_order_cursor(cursor):
+    """Giải mã cursor về (created_at, _id)"""
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.fromisoformat(created_at)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    return created_at, ObjectId(order_id) if ObjectId.is_valid(order_id) else order_id
+
+class InsufficientStockError(ValueError):
+    def __init__(self, failures):
+        super().__init__('Insufficient stock for one or more items')
+        self.failures = failures
 
 class OrderService:
-    def __init__(self, db_service):
+    def __init__(self, db_service, cache=None, order_numbers=None):
         self.db = db_service
+        self.cache = cache
+        self._count_cache = LocalCache(
+            max_entries=COUNT_CACHE_MAX_ENTRIES,
+            max_bytes=COUNT_CACHE_MAX_ENTRIES * 1024,
+            ttl=COUNT_CACHE_TTL
+        )
+        # Các OrderService trong cùng process dùng chung một khối số đơn hàng
+        self.order_numbers = order_numbers or shared_order_number_generator(db_service)
+
+    def get_orders(self, filters, page=1, limit=20, cursor=None, count='cached'):
+        if count not in COUNT_MODES:
+            raise ValueError('Invalid count mode')
+
+        query = self._build_order_query(filters)
+
+        # Có cursor (kể cả chuỗi rỗng cho trang đầu) thì phân trang theo keyset
+        if cursor is not None:
+            return self._get_orders_by_cursor(query, cursor, limit, count)
+
+        # Lấy danh sách orders và sắp xếp theo thời gian tạo mới nhất
+        orders = (self.db.orders.find(query, ORDER_SERIALIZER.projection)
+                    .sort(ORDER_SORT)
+                    .skip((page-1)*limit)
+                    .limit(limit))
+        
+        # Format response
+        order_list = ORDER_SERIALIZER.serialize_many(orders)
+        total = self._count_orders(query, count)
+        
+        return {
+            'orders': order_list,
+            'total': total,
+            'page': page,
+            'pages': (total + limit - 1) // limit if total is not None else None
+        }
 
-    def get_orders(self, filters, page=1, limit=20):
+    def export_orders(self, filters, batch_size=EXPORT_BATCH_SIZE):
+        """Iterator các đơn hàng đã serialize, đọc từ cursor theo từng batch (bộ nhớ không đổi).
+
+        Khác get_orders: start_date/end_date dùng độc lập và end_date tính trọn ngày.
+        """
+        query = self._build_order_query({'status': filters.get('status'), 'customer_id': filters.get('customer_id')})
+        created_at = {}
+        if filters.get('start_date'):
+            created_at['$gte'] = datetime.strptime(filters['start_date'], '%Y-%m-%d')
+        if filters.get('end_date'):
+            created_at['$lt'] = datetime.strptime(filters['end_date'], '%Y-%m-%d') + timedelta(days=1)
+        if created_at:
+            query['created_at'] = created_at
+
+        cursor = (self.db.orders.find(query, ORDER_SERIALIZER.projection)
+                    .sort(EXPORT_SORT)
+                    .batch_size(batch_size))
+        return ORDER_SERIALIZER.iter_serialize(cursor)
+
+    def _build_order_query(self, filters):
         query = {}
         
         if filters.get('status'):
@@ -18,84 +145,63 @@ class OrderService:
                 '$gte': datetime.strptime(filters['start_date'], '%Y-%m-%d'),
                 '$lte': datetime.strptime(filters['end_date'], '%Y-%m-%d')
             }
+        return query
+
+    def _get_orders_by_cursor(self, query, cursor, limit, count):
+        page_query = query
+        if cursor:
+            created_at, order_id = decode_order_cursor(cursor)
+            # Lấy các đơn đứng sau (created_at, _id) theo thứ tự giảm dần
+            page_query = {'$and': [query, {'$or': [
+                {'created_at': {'$lt': created_at}},
+                {'created_at': created_at, '_id': {'$lt': order_id}}
+            ]}]}
+
+        # Lấy dư một đơn để biết còn trang sau hay không
+        orders = list(self.db.orders.find(page_query, ORDER_SERIALIZER.projection)
+                        .sort(ORDER_SORT)
+                        .limit(limit + 1))
+        has_more = len(orders) > limit
+        orders = orders[:limit]
 
-        # Lấy danh sách orders và sắp xếp theo thời gian tạo mới nhất
-        orders = list(self.db.orders.find(query)
-                    .sort('created_at', -1)
-                    .skip((page-1)*limit)
-                    .limit(limit))
-        
-        total = self.db.orders.count_documents(query)
-        
-        # Format response
-        order_list = []
-        for order in orders:
-            formatted_order = {
-                '_id': str(order['_id']),
-                'order_number': order['order_number'],
-                'customer_id': str(order['customer_id']) if order.get('customer_id') else None,
-                'items': [{
-                    'product_id': str(item['product_id']),
-                    'name': item['name'],
-                    'price': item['price'],
-                    'quantity': item['quantity'],
-                    'discount': item.get('discount', 0),
-                    'subtotal': item['subtotal']
-                } for item in order['items']],
-                'subtotal': order['subtotal'],
-                'tax': order['tax'],
-                'total': order['total'],
-                'payment_method': order['payment_method'],
-                'status': order['status'],
-                'notes': order.get('notes'),
-                'created_by': str(order['created_by']) if order.get('created_by') else None,
-                'created_at': order['created_at'].isoformat(),
-                'updated_at': order['updated_at'].isoformat()
-            }
-            order_list.append(formatted_order)
-        
         return {
-            'orders': order_list,
-            'total': total,
-            'page': page,
-            'pages': (total + limit - 1) // limit
+            'orders': ORDER_SERIALIZER.serialize_many(orders),
+            'next_cursor': encode_order_cursor(orders[-1]) if has_more else None,
+            'has_more': has_more,
+            'limit': limit,
+            'total': self._count_orders(query, count)
         }
 
+    def _count_orders(self, query, mode):
+        if mode == 'none':
+            return None
+        if mode == 'exact':
+            return self.db.orders.count_documents(query)
+        if mode == 'estimated' and not query:
+            # Đọc từ metadata của collection, không quét index
+            return self.db.orders.estimated_document_count()
+
+        # Cache tổng số theo từng bộ lọc trong một khoảng ngắn
+        key = json.dumps(query, default=str, sort_keys=True)
+        found, total = self._count_cache.get(key)
+        if found:
+            return total
+
+        total = self.db.orders.count_documents(query)
+        self._count_cache.set(key, total, size=len(key))
+        return total
+
     def get_order(self, order_id):
         try:
             # Kiểm tra và chuyển đổi ObjectId
             if not ObjectId.is_valid(order_id):
                 return None
                 
-            order = self.db.orders.find_one({'_id': ObjectId(order_id)})
+            order = self.db.orders.find_one({'_id': ObjectId(order_id)}, ORDER_SERIALIZER.projection)
             if not order:
                 return None
                 
-            # Format response
-            formatted_order = {
-                '_id': str(order['_id']),
-                'order_number': order['order_number'],
-                'customer_id': str(order['customer_id']) if order.get('customer_id') else None,
-                'items': [{
-                    'product_id': str(item['product_id']),
-                    'name': item['name'],
-                    'price': item['price'],
-                    'quantity': item['quantity'],
-                    'discount': item.get('discount', 0),
-                    'subtotal': item['subtotal']
-                } for item in order['items']],
-                'subtotal': order['subtotal'],
-                'tax': order['tax'],
-                'total': order['total'],
-                'payment_method': order['payment_method'],
-                'status': order['status'],
-                'notes': order.get('notes'),
-                'created_by': str(order['created_by']) if order.get('created_by') else None,
-                'created_at': order['created_at'].isoformat(),
-                'updated_at': order['updated_at'].isoformat()
-            }
-            
-            return formatted_order
+            return ORDER_SERIALIZER.serialize(order)
             
         except Exception as e:
             print(f"Error getting order: {str(e)}")
@@ -103,60 +209,30 @@ class OrderService:
 
     def get_order_by_number(self, order_number):
         try:
-            order = self.db.orders.find_one({'order_number': order_number})
+            order = self.db.orders.find_one({'order_number': order_number}, ORDER_SERIALIZER.projection)
             if not order:
                 return None
                 
-            # Format response giống như get_order
-            formatted_order = {
-                '_id': str(order['_id']),
-                'order_number': order['order_number'],
-                'customer_id': str(order['customer_id']) if order.get('customer_id') else None,
-                'items': [{
-                    'product_id': str(item['product_id']),
-                    'name': item['name'],
-                    'price': item['price'],
-                    'quantity': item['quantity'],
-                    'discount': item.get('discount', 0),
-                    'subtotal': item['subtotal']
-                } for item in order['items']],
-                'subtotal': order['subtotal'],
-                'tax': order['tax'],
-                'total': order['total'],
-                'payment_method': order['payment_method'],
-                'status': order['status'],
-                'notes': order.get('notes'),
-                'created_by': str(order['created_by']) if order.get('created_by') else None,
-                'created_at': order['created_at'].isoformat(),
-                'updated_at': order['updated_at'].isoformat()
-            }
-            
-            return formatted_order
+            return ORDER_SERIALIZER.serialize(order)
             
         except Exception as e:
             print(f"Error getting order by number: {str(e)}")
             return None
         
+    @invalidates('products')
     def create_order(self, data):
         try:
             # Tạo danh sách items
-            order_items = []
-            for item_data in data.get('items', []):
-                item = OrderItem(
+            order_items = [
+                OrderItem(
                     product_id=item_data['product_id'],
                     name=item_data['name'],
                     price=float(item_data['price']),
                     quantity=int(item_data['quantity']),
                     discount=float(item_data.get('discount', 0))
                 )
-                product = self.db.products.find_one({'_id': ObjectId(item_data['product_id'])})
-                if product:
-                    new_quantity = product['stock_quantity'] - item.quantity
-                    self.db.products.update_one(
-                        {'_id': ObjectId(item_data['product_id'])},
-                        {'$set': {'stock_quantity': new_quantity}}
-                    )
-                order_items.append(item)
+                for item_data in data.get('items', [])
+            ]
 
             # Tạo order mới
             order = Order(
@@ -165,35 +241,85 @@ class OrderService:
                 payment_method=data.get('payment_method', 'cash'),
                 status=data.get('status', 'pending'),
                 notes=data.get('notes'),
-                created_by=data.get('created_by') if ObjectId.is_valid(data.get('created_by')) else None
+                created_by=data.get('created_by') if ObjectId.is_valid(data.get('created_by')) else None,
+                order_number=self.order_numbers.next()
             )
 
             # Validate order
             order.validate()
+            order_dict = order.to_dict(for_api=False)
+
+            # Gộp số lượng theo sản phẩm (một sản phẩm có thể nằm trên nhiều dòng)
+            quantities = {}
+            for item in order_items:
+                quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+            def checkout(session):
+                # Lấy tồn kho của toàn bộ giỏ hàng trong một truy vấn
+                products = self.db.products.find(
+                    {'_id': {'$in': list(quantities)}},
+                    {'stock_quantity': 1},
+                    session=session
+                )
+                stock = {product['_id']: product.get('stock_quantity', 0) for product in products}
+                now = datetime.utcnow()
+
+                failures = self._stock_failures(order_items, quantities, stock)
+                if failures:
+                    raise InsufficientStockError(failures)
+
+                # Trừ tồn kho có điều kiện trong một lần bulk_write
+                result = self.db.products.bulk_write([
+                    UpdateOne(
+                        {'_id': product_id, 'stock_quantity': {'$gte': quantity}},
+                        # updated_at để BarcodeIndex (chế độ polling) thấy tồn kho mới
+                        {'$inc': {'stock_quantity': -quantity}, '$set': {'updated_at': now}}
+                    )
+                    for product_id, quantity in quantities.items()
+                ], ordered=False, session=session)
+
+                if result.matched_count != len(quantities):
+                    # Tồn kho thay đổi giữa lúc đọc và lúc ghi, huỷ toàn bộ transaction
+                    raise InsufficientStockError([
+                        self._stock_failure(item, quantities[item.product_id], None,
+                                            'Stock changed during checkout')
+                        for item in order_items
+                    ])
+
+                self.db.orders.insert_one(order_dict, session=session)
+                # Điểm thưởng và rollup doanh thu do outbox worker xử lý sau khi commit
+                self._publish_status_change(order_dict, None, order_dict['status'], session)
 
             # Lưu vào database
-            order_dict = order.to_dict()
-            result = self.db.orders.insert_one(order_dict)
-            
-            # Format response
-            response = order_dict.copy()
-            response['_id'] = str(result.inserted_id)
-            if response.get('customer_id'):
-                response['customer_id'] = str(response['customer_id'])
-            if response.get('created_by'):
-                response['created_by'] = str(response['created_by'])
-            response['created_at'] = response['created_at'].isoformat()
-            response['updated_at'] = response['updated_at'].isoformat()
+            run_in_transaction(self.db, checkout)
             
-            # Format items
-            for item in response['items']:
-                item['product_id'] = str(item['product_id'])
-
-            return response
+            return ORDER_SERIALIZER.serialize(order_dict)
 
+        except InsufficientStockError:
+            raise
         except Exception as e:
             print(f"Error creating order: {str(e)}")
             raise ValueError(str(e))
+
+    def _stock_failures(self, order_items, quantities, stock):
+        failures = []
+        for item in order_items:
+            requested = quantities[item.product_id]
+            if item.product_id not in stock:
+                failures.append(self._stock_failure(item, requested, None, 'Product not found'))
+            elif stock[item.product_id] < requested:
+                failures.append(self._stock_failure(item, requested, stock[item.product_id], 'Insufficient stock'))
+        return failures
+
+    @staticmethod
+    def _stock_failure(item, requested, available, reason):
+        return {
+            'product_id': str(item.product_id),
+            'name': item.name,
+            'requested': requested,
+            'available': available,
+            'reason': reason
+        }
         
     def update_order_by_number(self, order_number, data):
         try:
@@ -224,15 +350,14 @@ class OrderService:
             updates['tax'] = 0
             updates['total'] = subtotal + updates['tax']
 
-            # Thực hiện cập nhật
-            self.db.orders.update_one(
+            # Thực hiện cập nhật và lấy đơn hàng sau khi cập nhật
+            updated_order = self.db.orders.find_one_and_update(
                 {'order_number': order_number},
-                {'$set': updates}
+                {'$set': updates},
+                projection=ORDER_SERIALIZER.projection,
+                return_document=ReturnDocument.AFTER
             )
-
-            # Lấy và format đơn hàng sau khi cập nhật
-            updated_order = self.get_order_by_number(order_number)
-            return updated_order
+            return ORDER_SERIALIZER.serialize(updated_order) if updated_order else None
 
         except Exception as e:
             print(f"Error updating order: {str(e)}")
@@ -287,9 +412,9 @@ class OrderService:
         # Restore inventory
         self._update_inventory(order['items'], decrease=False)
 
-        # Reverse customer points
-        if order.get('customer_id'):
-            self._reverse_customer_points(order['customer_id'], order['total'])
+        # Reverse customer points (qua outbox)
+        if order['status'] == SALES_STATUS:
+            publish_event(self.db, ORDER_REVERSED, order_event_payload(order))
 
         # Update order status
         self.db.update_one(
@@ -325,31 +450,34 @@ class OrderService:
             print(f"Error voiding order: {str(e)}")
             return False
 
+    @invalidates('products')
     def update_order_status_by_number(self, order_number, status):
         try:
             order = self.db.orders.find_one({'order_number': order_number})
             if not order:
                 return None
 
-            if status == 'completed':
-                # Cập nhật inventory khi hoàn thành đơn
-                for item in order['items']:
-                    self.db.products.update_one(
-                        {'_id': item['product_id']},
-                        {'$inc': {'stock_quantity': -item['quantity']}}
-                    )
-
-            result = self.db.orders.update_one(
-                {'order_number': order_number},
-                {
-                    '$set': {
-                        'status': status,
-                        'updated_at': datetime.utcnow()
-                    }
-                }
-            )
-
-            if result.modified_count:
+            def change_status(session):
+                # Chỉ ghi nếu trạng thái chưa bị request khác đổi, để tồn kho và rollup
+                # không bị cộng/trừ hai lần
+                result = self.db.orders.update_one(
+                    {'order_number': order_number, 'status': order['status']},
+                    {
+                        '$set': {
+                            'status': status,
+                            'updated_at': datetime.utcnow()
+                        }
+                    },
+                    session=session
+                )
+                if result.modified_count:
+                    if status == 'completed' and order['status'] != 'completed':
+                        # Cập nhật inventory khi hoàn thành đơn
+                        self._adjust_stock(order['items'], -1, session)
+                    self._publish_status_change(order, order['status'], status, session)
+                return result.modified_count
+
+            if run_in_transaction(self.db, change_status):
                 return self.get_order_by_number(order_number)
             return None
 
@@ -357,58 +485,52 @@ class OrderService:
             print(f"Error updating order status: {str(e)}")
             return None
         
+    @invalidates('products')
     def void_order_by_number(self, order_number):
         try:
             order = self.db.orders.find_one({'order_number': order_number})
             if not order or order['status'] == 'cancelled':
                 return False
 
-            # Hoàn lại inventory nếu đơn đã completed
-            if order['status'] == 'completed':
-                for item in order['items']:
-                    self.db.products.update_one(
-                        {'_id': item['product_id']},
-                        {'$inc': {'stock_quantity': item['quantity']}}
-                    )
+            def cancel(session):
+                result = self.db.orders.update_one(
+                    {'order_number': order_number, 'status': order['status']},
+                    {
+                        '$set': {
+                            'status': 'cancelled',
+                            'updated_at': datetime.utcnow()
+                        }
+                    },
+                    session=session
+                )
+                if result.modified_count:
+                    # Hoàn lại inventory nếu đơn đã completed
+                    if order['status'] == 'completed':
+                        self._adjust_stock(order['items'], 1, session)
+                    self._publish_status_change(order, order['status'], 'cancelled', session)
+                return result.modified_count
 
-            result = self.db.orders.update_one(
-                {'order_number': order_number},
-                {
-                    '$set': {
-                        'status': 'cancelled',
-                        'updated_at': datetime.utcnow()
-                    }
-                }
-            )
-            
-            return result.modified_count > 0
+            return run_in_transaction(self.db, cancel) > 0
 
         except Exception as e:
             print(f"Error voiding order: {str(e)}")
             return False
 
-    def _update_customer_points(self, customer_id: ObjectId, total: float):
-        points_earned = int(total / 10000)  # 1 point per 10,000
-        self.db.update_one(
-            'customers',
-            {'_id': customer_id},
-            {
-                '$inc': {
-                    'points': points_earned,
-                    'total_spent': total
-                }
-            }
-        )
-
-    def _reverse_customer_points(self, customer_id: ObjectId, total: float):
-        points_reversed = int(total / 10000)
-        self.db.update_one(
-            'customers',
-            {'_id': customer_id},
-            {
-                '$inc': {
-                    'points': -points_reversed,
-                    'total_spent': -total
-                }
-            }
-        )
+    def _adjust_stock(self, items, sign, session):
+        """Cộng (sign=1) hoặc trừ (sign=-1) tồn kho theo các dòng của đơn, trong transaction của caller"""
+        now = datetime.utcnow()
+        self.db.products.bulk_write([
+            UpdateOne(
+                {'_id': item['product_id']},
+                # updated_at để BarcodeIndex (chế độ polling) thấy tồn kho mới
+                {'$inc': {'stock_quantity': sign * item['quantity']}, '$set': {'updated_at': now}}
+            )
+            for item in items
+        ], ordered=False, session=session)
+
+    def _publish_status_change(self, order, old_status, new_status, session=None):
+        """Ghi event vào outbox khi đơn chuyển vào/ra trạng thái completed"""
+        if old_status != SALES_STATUS and new_status == SALES_STATUS:
+            publish_event(self.db, ORDER_COMPLETED, order_event_payload(order), session=session)
+        elif old_status == SALES_STATUS and new_status != SALES_STATUS:
+            publish_event(self.db, ORDER_REVERSED, order_event_payload(order), session=session)
@@ -0,0 +1,170 @@
+from app.utils.index_utils import declare_index
+from app.utils.transaction_utils import run_in_transaction
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_LEASE = timedelta(seconds=60)
+# Giữ event đã xử lý và receipt chống trùng trong một tuần
+OUTBOX_RETENTION = timedelta(days=7)
+
+declare_index('outbox', [('status', 1), ('available_at', 1)])
+declare_index('outbox', 'expires_at', expireAfterSeconds=0)
+declare_index('outbox_receipts', 'expires_at', expireAfterSeconds=0)
+
+class RetryLater(Exception):
+    """Handler chưa xử lý được lúc này; event được giao lại sau `delay` mà không tính vào số lần thử"""
+
+    def __init__(self, message: str, delay: timedelta = timedelta(seconds=30)):
+        super().__init__(message)
+        self.delay = delay
+
+def outbox_receipt(event_id, name: str) -> dict:
+    """Receipt đánh dấu handler `name` đã xử lý event"""
+    now = datetime.utcnow()
+    return {'_id': f'{event_id}:{name}', 'created_at': now, 'expires_at': now + OUTBOX_RETENTION}
+
+def publish_event(db, event_type: str, payload: dict, session=None):
+    """Ghi event vào outbox; truyền session để event commit cùng transaction với dữ liệu chính"""
+    now = datetime.utcnow()
+    db.outbox.insert_one({
+        'type': event_type,
+        'payload': payload,
+        'status': 'pending',
+        'attempts': 0,
+        'available_at': now,
+        'created_at': now
+    }, session=session)
+
+class OutboxWorker:
+    """Pool thread xử lý event trong outbox, giao ít nhất một lần (at-least-once).
+
+    Mỗi handler ghi receipt (event_id, tên handler) để bỏ qua event đã xử lý khi bị giao lại;
+    handler transactional ghi receipt và dữ liệu trong cùng transaction nên chỉ có hiệu lực một lần.
+    drain() chạy đồng bộ trong thread hiện tại, dùng cho test và CLI thay cho pool.
+    """
+
+    def __init__(self, db, app=None, workers=2, poll_interval=0.5):
+        self.db = db
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.handlers = {}  # event type -> [(name, handler, transactional)]
+        self._stop = threading.Event()
+
+    def register(self, event_type: str, name: str, handler, transactional: bool = True):
+        """handler(db, payload, session); session là None với handler không transactional"""
+        self.handlers.setdefault(event_type, []).append((name, handler, transactional))
+        return self
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'outbox-worker-{index}', daemon=True)
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def drain(self, limit: int = None) -> int:
+        """Xử lý hết event đang chờ ngay trong thread hiện tại, trả về số event đã xử lý"""
+        processed = 0
+        while limit is None or processed < limit:
+            event = self._claim()
+            if event is None:
+                break
+            self._process(event)
+            processed += 1
+        return processed
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.app is not None:
+                    with self.app.app_context():
+                        processed = self.drain(limit=100)
+                else:
+                    processed = self.drain(limit=100)
+            except Exception as e:
+                logger.error(f"Outbox worker failed: {str(e)}")
+                processed = 0
+            if not processed:
+                self._stop.wait(self.poll_interval)
+
+    def _claim(self):
+        now = datetime.utcnow()
+        return self.db.outbox.find_one_and_update(
+            {'$or': [
+                {'status': 'pending', 'available_at': {'$lte': now}},
+                # Worker giữ event đã chết: giao lại sau khi hết lease
+                {'status': 'processing', 'locked_until': {'$lt': now}}
+            ]},
+            {
+                '$set': {'status': 'processing', 'locked_until': now + OUTBOX_LEASE},
+                '$inc': {'attempts': 1}
+            },
+            sort=[('available_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _process(self, event):
+        try:
+            for name, handler, transactional in self.handlers.get(event['type'], []):
+                self._dispatch(event, name, handler, transactional)
+        except RetryLater as e:
+            logger.info(f"Outbox event {event['_id']} ({event['type']}) deferred: {str(e)}")
+            self.db.outbox.update_one(
+                {'_id': event['_id']},
+                {
+                    '$set': {'status': 'pending', 'available_at': datetime.utcnow() + e.delay},
+                    '$inc': {'attempts': -1}
+                }
+            )
+            return
+        except Exception as e:
+            logger.error(f"Outbox event {event['_id']} ({event['type']}) failed: {str(e)}")
+            failed = event['attempts'] >= OUTBOX_MAX_ATTEMPTS
+            self.db.outbox.update_one(
+                {'_id': event['_id']},
+                {'$set': {
+                    'status': 'failed' if failed else 'pending',
+                    # Backoff luỹ thừa: 2, 4, 8, ... giây
+                    'available_at': datetime.utcnow() + timedelta(seconds=2 ** event['attempts']),
+                    'last_error': str(e)
+                }}
+            )
+            return
+
+        self.db.outbox.update_one(
+            {'_id': event['_id']},
+            {'$set': {'status': 'done', 'expires_at': datetime.utcnow() + OUTBOX_RETENTION}}
+        )
+
+    def _dispatch(self, event, name, handler, transactional):
+        receipt = outbox_receipt(event['_id'], name)
+
+        if transactional:
+            def apply(session):
+                # Không bắt DuplicateKeyError ở đây: lỗi ghi làm transaction bị abort.
+                # Hai worker cùng ghi một receipt sẽ gặp write conflict và with_transaction chạy lại.
+                if self.db.outbox_receipts.find_one({'_id': receipt['_id']}, {'_id': 1}, session=session):
+                    return  # Đã xử lý ở lần giao trước
+                self.db.outbox_receipts.insert_one(receipt, session=session)
+                handler(self.db, event['payload'], session)
+
+            run_in_transaction(self.db, apply)
+            return
+
+        # Tác vụ bên ngoài (email, máy in) không rollback được: kiểm tra receipt trước, ghi sau
+        if self.db.outbox_receipts.find_one({'_id': receipt['_id']}, {'_id': 1}):
+            return
+        handler(self.db, event['payload'], None)
+        try:
+            self.db.outbox_receipts.insert_one(receipt)
+        except DuplicateKeyError:
+            pass
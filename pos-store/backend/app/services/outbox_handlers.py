@@ -0,0 +1,63 @@
+from app.services.outbox import RetryLater
+from app.services.report_service import SALES_HANDLER, record_order_sales, sales_rebuild_running
+
+# Các loại event do service ghi vào outbox
+ORDER_COMPLETED = 'order.completed'
+ORDER_REVERSED = 'order.reversed'  # đơn completed bị huỷ hoặc chuyển về trạng thái khác
+USER_REGISTERED = 'user.registered'
+
+POINTS_PER_AMOUNT = 10000  # 1 điểm cho mỗi 10,000
+
+def order_event_payload(order):
+    """Ảnh chụp các trường của đơn hàng mà handler cần"""
+    return {
+        'order': {
+            field: order.get(field)
+            for field in ('_id', 'order_number', 'customer_id', 'items', 'tax', 'total',
+                          'payment_method', 'created_at')
+        }
+    }
+
+def _adjust_customer_points(db, order, sign, session):
+    if not order.get('customer_id'):
+        return
+    db.customers.update_one(
+        {'_id': order['customer_id']},
+        {'$inc': {
+            'points': sign * int(order['total'] / POINTS_PER_AMOUNT),
+            'total_spent': sign * order['total']
+        }},
+        session=session
+    )
+
+def award_points(db, payload, session):
+    _adjust_customer_points(db, payload['order'], 1, session)
+
+def reverse_points(db, payload, session):
+    _adjust_customer_points(db, payload['order'], -1, session)
+
+def _record_sales(db, payload, sign, session):
+    # sales_daily đang được dựng lại: giao lại event sau, bản dựng tự gộp đơn này (xem rebuild_sales_daily)
+    if sales_rebuild_running(db, session=session):
+        raise RetryLater('sales_daily rebuild in progress')
+    record_order_sales(db, payload['order'], sign, session=session)
+
+def add_sales(db, payload, session):
+    _record_sales(db, payload, 1, session)
+
+def remove_sales(db, payload, session):
+    _record_sales(db, payload, -1, session)
+
+def register_default_handlers(worker, mail_service):
+    worker.register(ORDER_COMPLETED, 'points', award_points)
+    worker.register(ORDER_COMPLETED, SALES_HANDLER, add_sales)
+    worker.register(ORDER_REVERSED, 'points', reverse_points)
+    worker.register(ORDER_REVERSED, SALES_HANDLER, remove_sales)
+    # Gửi đồng bộ trong outbox worker: lỗi SMTP làm event được giao lại (backoff), receipt
+    # chỉ được ghi sau khi server nhận thư nên restart cũng không làm mất email
+    worker.register(
+        USER_REGISTERED, 'verification_email',
+        lambda db, payload, session: mail_service.send_verification_email(payload['email'], payload['token']),
+        transactional=False
+    )
+    return worker
@@ -0,0 +1,67 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+import os
+import threading
+
+class PasswordHasherBusy(Exception):
+    """Hàng đợi hash đã đầy, route trả về 429"""
+
+class PasswordHasher:
+    """Chạy hash/verify mật khẩu trong process pool giới hạn, không chiếm thread của request.
+
+    Quá max_pending phép tính đang chờ thì từ chối ngay (PasswordHasherBusy) thay vì xếp hàng.
+    workers = 0 thì tính ngay trên thread hiện tại (dev/test).
+    """
+
+    def __init__(self, method: str = 'scrypt:32768:8:1', workers: int = 2, max_pending: int = 16,
+                 timeout: float = 10):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._method_prefix = None
+
+    def hash(self, password: str) -> str:
+        return self._submit(generate_password_hash, password, self.method)
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self._submit(check_password_hash, hashed, password)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """Hash được tạo bằng thuật toán/tham số khác cấu hình hiện tại"""
+        if self._method_prefix is None:
+            # werkzeug chuẩn hoá method (vd. 'scrypt' -> 'scrypt:32768:8:1'), lấy từ một hash mẫu
+            self._method_prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return hashed.split('$', 1)[0] != self._method_prefix
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy('Too many password operations in progress')
+        if self.workers <= 0:
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Trả slot khi process con tính xong, kể cả khi request đã bỏ chờ vì timeout
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeoutError:
+            raise PasswordHasherBusy('Password operation timed out')
+
+    def _get_executor(self):
+        # Pool tạo sau khi gunicorn fork, mỗi worker một pool riêng
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._pid = os.getpid()
+            return self._executor
@@ -1,6 +1,13 @@
 from app.models.payment import Payment
+from app.utils.index_utils import declare_index, declare_query
+from app.utils.transaction_utils import run_in_transaction
 from datetime import datetime
 
+declare_index('payments', 'order_number')
+declare_index('refunds', 'order_number')
+declare_query('by_order_number', 'payments', {'order_number': 'ORD', 'status': 'completed'})
+declare_query('by_order_number', 'refunds', {'order_number': 'ORD'})
+
 class PaymentService:
     def __init__(self, db_service):
         self.db = db_service
@@ -87,8 +94,8 @@ class PaymentService:
             if payment_dict.get('verified_at'):
                 payment_dict['verified_at'] = payment_dict['verified_at'].isoformat()
             
-            # Lưu vào database
-            self.db.payments.insert_one(payment_dict)
+            # Lưu vào database (transaction để Idempotency-Key được đánh dấu cùng lúc)
+            run_in_transaction(self.db, lambda session: self.db.payments.insert_one(payment_dict, session=session))
 
             return payment_dict
 
@@ -114,29 +121,39 @@ class PaymentService:
                 verified = self._verify_momo_payment(payment['reference'], verification_data)
 
             if verified:
-                # Cập nhật trạng thái payment
                 current_time = datetime.utcnow()
-                self.db.payments.update_one(
-                    {'order_number': order_number},
-                    {
-                        '$set': {
-                            'status': 'completed',
-                            'verified_at': current_time,
-                            'updated_at': current_time
-                        }
-                    }
-                )
-
-                # Cập nhật trạng thái order
-                self.db.orders.update_one(
-                    {'order_number': order_number},
-                    {
-                        '$set': {
-                            'payment_status': 'paid',
-                            'updated_at': current_time
-                        }
-                    }
-                )
+
+                def complete(session):
+                    # Cập nhật trạng thái payment (chỉ khi chưa completed) và order trong cùng transaction
+                    result = self.db.payments.update_one(
+                        {'_id': payment['_id'], 'status': {'$ne': 'completed'}},
+                        {
+                            '$set': {
+                                'status': 'completed',
+                                'verified_at': current_time,
+                                'updated_at': current_time
+                            }
+                        },
+                        session=session
+                    )
+                    if not result.modified_count:
+                        return False
+
+                    # Cập nhật trạng thái order
+                    self.db.orders.update_one(
+                        {'order_number': order_number},
+                        {
+                            '$set': {
+                                'payment_status': 'paid',
+                                'updated_at': current_time
+                            }
+                        },
+                        session=session
+                    )
+                    return True
+
+                if not run_in_transaction(self.db, complete):
+                    return {'message': 'Payment already completed'}
 
                 return {
                     'order_number': order_number,
@@ -177,21 +194,26 @@ class PaymentService:
             if payment['method'] == 'cash':
                 refund['status'] = 'completed'
                 refund['completed_at'] = datetime.utcnow()
-                
-                # Cập nhật trạng thái order
-                self.db.orders.update_one(
-                    {'order_number': order_number},
-                    {
-                        '$set': {
-                            'payment_status': 'refunded',
-                            'updated_at': datetime.utcnow()
-                        }
-                    }
-                )
-            
-            # Lưu refund record
-            self.db.refunds.insert_one(refund)
-            
+
+            def record_refund(session):
+                if refund['status'] == 'completed':
+                    # Cập nhật trạng thái order
+                    self.db.orders.update_one(
+                        {'order_number': order_number},
+                        {
+                            '$set': {
+                                'payment_status': 'refunded',
+                                'updated_at': datetime.utcnow()
+                            }
+                        },
+                        session=session
+                    )
+
+                # Lưu refund record
+                self.db.refunds.insert_one(refund, session=session)
+
+            run_in_transaction(self.db, record_refund)
+
             # Format response
             refund['_id'] = str(refund['_id'])
             refund['payment_id'] = str(refund['payment_id'])
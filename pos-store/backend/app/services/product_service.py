@@ -1,28 +1,94 @@
 from app.models.product import Product
 from app.utils.pagination_utils import paginate_results
+from app.utils.index_utils import declare_index, declare_query
+from app.utils.search_utils import build_search_fields, fold_accents, tokenize
+from app.utils.serializer_utils import DocumentSerializer
+from app.services.cache import cached, invalidates
 from datetime import datetime
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import csv
+import json
+import logging
+import re
+import threading
+
+# Các field tìm kiếm nội bộ, không trả về API
+SEARCH_FIELDS_PROJECTION = {'search_name': 0, 'name_tokens': 0, 'search_tokens': 0}
+
+PRODUCT_SERIALIZER = DocumentSerializer(
+    ['_id', 'name', 'barcode', 'description', 'category_id', 'price', 'cost_price', 'unit',
+     'image_url', 'stock_quantity', 'min_stock_level', 'max_stock_level', 'is_active',
+     'created_at', 'updated_at'],
+    defaults={
+        'price': 0,
+        'cost_price': 0,
+        'stock_quantity': 0,
+        'min_stock_level': 0,
+        'max_stock_level': 0,
+        'is_active': True
+    }
+)
+
+logger = logging.getLogger(__name__)
+
+PRODUCTS_VERSION_ID = 'products_version'
+# Đếm tổng số kết quả tìm kiếm tới mức này; nhiều hơn thì trả total = None và has_more
+SEARCH_COUNT_LIMIT = 1000
+SEARCH_SORT = [('search_name', 1), ('_id', 1)]
+BATCH_CHUNK_SIZE = 1000
+
+declare_index('products', 'barcode', unique=True)
+declare_index('products', [('name', 'text'), ('barcode', 1)], unique=True)
+declare_index('products', 'category_id')
+# Lọc theo token và trả về theo search_name ngay trên index, không sort trong bộ nhớ
+declare_index('products', [('search_tokens', 1), ('search_name', 1), ('_id', 1)])
+declare_index('products', 'updated_at')
+declare_query('by_barcode', 'products', {'barcode': ''})
+declare_query('by_category', 'products', {'category_id': ObjectId()})
+declare_query('search', 'products', {'search_tokens': {'$all': ['ca', 'phe']}}, SEARCH_SORT)
+
+def bump_products_version(db, session=None):
+    """Báo các process đang polling cần nạp lại toàn bộ (thao tác xoá không để lại updated_at).
+
+    Thêm/sửa sản phẩm không cần gọi: polling đọc theo updated_at. Không gọi trong transaction
+    của checkout vì mọi đơn hàng sẽ ghi vào cùng một document và chạy tuần tự.
+    """
+    db.counters.update_one(
+        {'_id': PRODUCTS_VERSION_ID},
+        {'$inc': {'seq': 1}},
+        upsert=True,
+        session=session
+    )
 
 class ProductService:
-    def __init__(self, db):
+    def __init__(self, db, barcode_index=None, cache=None):
         self.db = db
-        self.db.products.create_index([('name', 'text'), ('barcode', 1)], unique=True)
+        self.barcode_index = barcode_index
+        self.cache = cache
 
     def get_products(self, filters, page=1, limit=20):
         query = {}
         if filters.get('category'):
             query['category_id'] = ObjectId(filters['category'])
-        if filters.get('search'):
-            query['$or'] = [
-                {'name': {'$regex': filters['search'], '$options': 'i'}},
-                {'description': {'$regex': filters['search'], '$options': 'i'}}
-            ]
-
-        products = list(self.db.products.find(query)
-                    .skip((page-1)*limit)
-                    .limit(limit))
-        
-        total = self.db.products.count_documents(query)
+
+        terms = tokenize(filters.get('search'))
+        if terms:
+            query['search_tokens'] = {'$all': terms}
+            products = self._search_products(query, terms, filters['search'], (page-1)*limit, limit + 1)
+            has_more = len(products) > limit
+            products = products[:limit]
+            # Tiền tố ngắn có thể khớp gần hết catalog: không đếm quá SEARCH_COUNT_LIMIT
+            total = self.db.products.count_documents(query, limit=SEARCH_COUNT_LIMIT + 1)
+            if total > SEARCH_COUNT_LIMIT:
+                total = None
+        else:
+            products = list(self.db.products.find(query, SEARCH_FIELDS_PROJECTION)
+                        .skip((page-1)*limit)
+                        .limit(limit))
+            total = self.db.products.count_documents(query)
+            has_more = page * limit < total
         
         # Format response
         product_list = []
@@ -40,35 +106,64 @@ class ProductService:
             'products': product_list,
             'total': total,
             'page': page,
-            'pages': (total + limit - 1) // limit
+            'pages': (total + limit - 1) // limit if total is not None else None,
+            'has_more': has_more
         }
 
+    def _search_products(self, query, terms, search, skip, limit):
+        """Xếp hạng theo ba tầng, mỗi tầng là một truy vấn đọc theo thứ tự index (search_tokens, search_name):
+        tên bắt đầu bằng chuỗi tìm kiếm, sau đó mọi từ khớp trong tên, cuối cùng là khớp qua mô tả.
+        Chỉ đọc đủ skip + limit bản ghi, không xếp hạng toàn bộ kết quả trong bộ nhớ.
+        """
+        name_prefix = re.compile('^' + re.escape(fold_accents(search).strip()))
+        tiers = [
+            {**query, 'search_name': name_prefix},
+            {**query, 'search_name': {'$not': name_prefix}, 'name_tokens': {'$all': terms}},
+            {**query, 'search_name': {'$not': name_prefix}, 'name_tokens': {'$not': {'$all': terms}}}
+        ]
+
+        products = []
+        for tier in tiers:
+            if len(products) >= limit:
+                break
+            found = list(self.db.products.find(tier, SEARCH_FIELDS_PROJECTION)
+                         .sort(SEARCH_SORT)
+                         .skip(skip)
+                         .limit(limit - len(products)))
+            if skip and not found:
+                # Trang bắt đầu sau tầng này: trừ số bản ghi của tầng (đếm tối đa skip)
+                skip -= self.db.products.count_documents(tier, limit=skip)
+            else:
+                skip = 0
+            products.extend(found)
+        return products
+
+    def reindex_search(self, batch_size=1000, missing_only=False):
+        """Tính lại các field tìm kiếm cho toàn bộ sản phẩm (hoặc chỉ sản phẩm chưa có)"""
+        query = {'search_tokens': {'$exists': False}} if missing_only else {}
+        updated = 0
+        batch = []
+        for product in self.db.products.find(query, {'name': 1, 'description': 1}):
+            batch.append(UpdateOne(
+                {'_id': product['_id']},
+                {'$set': build_search_fields(product.get('name'), product.get('description'))}
+            ))
+            if len(batch) >= batch_size:
+                updated += self.db.products.bulk_write(batch, ordered=False).matched_count
+                batch = []
+        if batch:
+            updated += self.db.products.bulk_write(batch, ordered=False).matched_count
+        return updated
+
+    @cached('products')
     def get_product(self, product_id):
         try:
-            product = self.db.products.find_one({'_id': ObjectId(product_id)})
+            product = self.db.products.find_one({'_id': ObjectId(product_id)}, PRODUCT_SERIALIZER.projection)
             if not product:
                 return None
                 
             # Format response data
-            formatted_product = {
-                '_id': str(product['_id']),
-                'name': product['name'],
-                'barcode': product.get('barcode'),
-                'description': product.get('description'),
-                'category_id': str(product['category_id']) if product.get('category_id') else None,
-                'price': product.get('price', 0),
-                'cost_price': product.get('cost_price', 0),
-                'unit': product.get('unit'),
-                'image_url': product.get('image_url'),
-                'stock_quantity': product.get('stock_quantity', 0),
-                'min_stock_level': product.get('min_stock_level', 0),
-                'max_stock_level': product.get('max_stock_level', 0),
-                'is_active': product.get('is_active', True),
-                'created_at': product['created_at'].isoformat() if product.get('created_at') else None,
-                'updated_at': product['updated_at'].isoformat() if product.get('updated_at') else None
-            }
-            
-            return formatted_product
+            return PRODUCT_SERIALIZER.serialize(product)
             
         except Exception as e:
             print(f"Error getting product: {str(e)}")
@@ -76,37 +171,27 @@ class ProductService:
 
     def get_product_by_barcode(self, barcode):
         try:
-            # Tìm sản phẩm theo barcode
-            product = self.db.products.find_one({'barcode': barcode})
-            
-            if not product:
-                return None
-                
-            # Format response data
-            formatted_product = {
-                '_id': str(product['_id']),
-                'name': product['name'],
-                'barcode': product['barcode'],
-                'description': product.get('description'),
-                'category_id': str(product['category_id']) if product.get('category_id') else None,
-                'price': product.get('price', 0),
-                'cost_price': product.get('cost_price', 0),
-                'unit': product.get('unit'),
-                'image_url': product.get('image_url'),
-                'stock_quantity': product.get('stock_quantity', 0),
-                'min_stock_level': product.get('min_stock_level', 0),
-                'max_stock_level': product.get('max_stock_level', 0),
-                'is_active': product.get('is_active', True),
-                'created_at': product['created_at'].isoformat() if product.get('created_at') else None,
-                'updated_at': product['updated_at'].isoformat() if product.get('updated_at') else None
-            }
-            
-            return formatted_product
+            # Tra bảng barcode trong bộ nhớ trước, không cần round trip tới DB
+            if self.barcode_index is not None:
+                product = self.barcode_index.get(barcode)
+                if product is not None:
+                    return product
+
+            return self._find_product_by_barcode(barcode)
             
         except Exception as e:
             print(f"Error getting product by barcode: {str(e)}")
             return None
 
+    @cached('products')
+    def _find_product_by_barcode(self, barcode):
+        # Tìm sản phẩm theo barcode
+        product = self.db.products.find_one({'barcode': barcode}, PRODUCT_SERIALIZER.projection)
+        
+        # Format response data
+        return PRODUCT_SERIALIZER.serialize(product) if product else None
+
+    @invalidates('products')
     def create_product(self, data):
         current_time = datetime.utcnow()
         # Validate required fields
@@ -153,7 +238,7 @@ class ProductService:
         }
 
         # Thêm sản phẩm vào database
-        self.db.products.insert_one(product)
+        self.db.products.insert_one({**product, **build_search_fields(product['name'], product['description'])})
 
         # Trả về sản phẩm đã tạo
         product['_id'] = str(product['_id'])
@@ -164,6 +249,7 @@ class ProductService:
         
         return product
 
+    @invalidates('products')
     def update_product(self, product_id, data):
         try:
 
@@ -197,7 +283,7 @@ class ProductService:
             # Thực hiện cập nhật
             self.db.products.update_one(
                 {'_id': ObjectId(product_id)},
-                {'$set': updates}
+                {'$set': {**updates, **build_search_fields(updates['name'], updates['description'])}}
             )
 
             # Format response
@@ -212,6 +298,7 @@ class ProductService:
             print(f"Error updating product: {str(e)}")
             return None
 
+    @invalidates('products')
     def delete_product(self, product_id):
         try:
             # Kiểm tra sản phẩm tồn tại
@@ -223,6 +310,7 @@ class ProductService:
             result = self.db.products.delete_one({'_id': ObjectId(product_id)})
             
             if result.deleted_count:
+                bump_products_version(self.db)
                 return {
                     'product_id': str(product_id),
                     'product_name': product['name'],
@@ -235,61 +323,175 @@ class ProductService:
             print(f"Error deleting product: {str(e)}")
             return None
 
+    @invalidates('products')
     def batch_update(self, data):
-        results = {
+        results = self._new_batch_results()
+        items = data.get('products', [])
+
+        for chunk_start in range(0, len(items), BATCH_CHUNK_SIZE):
+            self._apply_batch(items[chunk_start:chunk_start + BATCH_CHUNK_SIZE], results)
+
+        results['total_processed'] = len(items)
+        return results
+
+    @invalidates('products')
+    def import_products(self, stream, format='csv'):
+        """Import cập nhật sản phẩm từ file CSV/NDJSON theo từng chunk, không nạp cả file vào bộ nhớ"""
+        results = self._new_batch_results()
+        chunk = []
+
+        for line_number, item in self._parse_import_rows(stream, format):
+            if isinstance(item, Exception):
+                self._batch_failed(results, None, f'Line {line_number}: {str(item)}', None)
+                results['total_processed'] += 1
+                continue
+
+            chunk.append(item)
+            if len(chunk) >= BATCH_CHUNK_SIZE:
+                self._apply_batch(chunk, results)
+                results['total_processed'] += len(chunk)
+                chunk = []
+
+        if chunk:
+            self._apply_batch(chunk, results)
+            results['total_processed'] += len(chunk)
+
+        return results
+
+    @staticmethod
+    def _parse_import_rows(stream, format):
+        if format == 'ndjson':
+            for line_number, line in enumerate(stream, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                    if not isinstance(item, dict):
+                        raise ValueError('Row must be a JSON object')
+                    yield line_number, item
+                except ValueError as e:
+                    yield line_number, e
+        elif format == 'csv':
+            # Dòng 1 là header, dữ liệu bắt đầu từ dòng 2
+            for line_number, row in enumerate(csv.DictReader(stream), start=2):
+                try:
+                    item = {key: value for key, value in row.items() if key and value not in (None, '')}
+                    if 'is_active' in item:
+                        item['is_active'] = item['is_active'].strip().lower() in ('1', 'true', 'yes')
+                    yield line_number, item
+                except (AttributeError, ValueError) as e:
+                    yield line_number, e
+        else:
+            raise ValueError(f'Unsupported import format: {format}')
+
+    def _apply_batch(self, items, results):
+        # Validate toàn bộ chunk trước khi chạm tới database
+        current_time = datetime.utcnow()
+        valid = []
+        for item in items:
+            try:
+                product_id = ObjectId(item.get('product_id'))
+                updates = self._batch_item_updates(item)
+            except Exception as e:
+                self._batch_failed(results, item.get('product_id'), str(e), item)
+                continue
+            updates['updated_at'] = current_time
+            valid.append((product_id, item, updates))
+
+        if not valid:
+            return
+
+        # Resolve toàn bộ product id trong một truy vấn $in
+        names = {
+            product['_id']: product['name']
+            for product in self.db.products.find(
+                {'_id': {'$in': [product_id for product_id, _, _ in valid]}},
+                {'name': 1}
+            )
+        }
+
+        operations = []
+        pending = []
+        for product_id, item, updates in valid:
+            if product_id not in names:
+                self._batch_failed(results, str(product_id), 'Product not found', item)
+                continue
+            operations.append(UpdateOne({'_id': product_id}, {'$set': updates}))
+            pending.append((product_id, item, updates))
+
+        if not operations:
+            return
+
+        errors = {}
+        try:
+            self.db.products.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = {error['index']: error.get('errmsg') for error in e.details.get('writeErrors', [])}
+
+        for index, (product_id, item, updates) in enumerate(pending):
+            if index in errors:
+                self._batch_failed(results, str(product_id), errors[index], item)
+                continue
+            results['success'].append({
+                'product_id': str(product_id),
+                'product_name': names[product_id],
+                'updates': {k: v for k, v in updates.items() if k != 'updated_at'},
+                'timestamp': current_time.isoformat()
+            })
+            results['total_success'] += 1
+
+    @staticmethod
+    def _batch_item_updates(item):
+        updates = {}
+        if 'quantity' in item:
+            updates['stock_quantity'] = int(item['quantity'])
+        if 'price' in item:
+            updates['price'] = float(item['price'])
+        if 'cost_price' in item:
+            updates['cost_price'] = float(item['cost_price'])
+        if 'is_active' in item:
+            updates['is_active'] = bool(item['is_active'])
+        return updates
+
+    @staticmethod
+    def _new_batch_results():
+        return {
             'success': [],
             'failed': [],
             'total_processed': 0,
             'total_success': 0,
             'total_failed': 0
         }
-        
-        for item in data.get('products', []):
-            try:
-                product_id = ObjectId(item.get('product_id'))
-                product = self.db.products.find_one({'_id': product_id})
-                
-                if not product:
-                    results['failed'].append({
-                        'product_id': str(product_id),
-                        'reason': 'Product not found',
-                        'data': item
-                    })
-                    results['total_failed'] += 1
-                    continue
 
-                updates = {}
-                if 'quantity' in item:
-                    updates['stock_quantity'] = int(item['quantity'])
-                if 'price' in item:
-                    updates['price'] = float(item['price'])
-                if 'cost_price' in item:
-                    updates['cost_price'] = float(item['cost_price'])
-                if 'is_active' in item:
-                    updates['is_active'] = bool(item['is_active'])
-                
-                updates['updated_at'] = datetime.utcnow()
+    @staticmethod
+    def _batch_failed(results, product_id, reason, item):
+        results['failed'].append({
+            'product_id': product_id,
+            'reason': reason,
+            'data': item
+        })
+        results['total_failed'] += 1
 
-                self.db.products.update_one(
-                    {'_id': product_id},
-                    {'$set': updates}
-                )
-                
-                results['success'].append({
-                    'product_id': str(product_id),
-                    'product_name': product['name'],
-                    'updates': {k: v for k, v in updates.items() if k != 'updated_at'},
-                    'timestamp': updates['updated_at'].isoformat()
-                })
-                results['total_success'] += 1
 
-            except Exception as e:
-                results['failed'].append({
-                    'product_id': item.get('product_id'),
-                    'reason': str(e),
-                    'data': item
-                })
-                results['total_failed'] += 1
-
-        results['total_processed'] = len(data.get('products', []))
-        return results
+def backfill_search_fields(db):
+    """Bổ sung field tìm kiếm cho sản phẩm tạo trước khi có search_tokens"""
+    try:
+        updated = ProductService(db).reindex_search(missing_only=True)
+    except Exception:
+        logger.exception('Backfill search fields failed')
+        return 0
+    if updated:
+        logger.info('Backfilled search fields for %d product(s)', updated)
+    return updated
+
+
+def backfill_search_fields_in_background(db) -> threading.Thread:
+    """Chạy backfill trên một thread riêng, không chặn lúc khởi động"""
+    thread = threading.Thread(
+        target=backfill_search_fields,
+        args=(db,),
+        name='search-backfill',
+        daemon=True
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,236 @@
+from app.services.outbox import outbox_receipt
+from app.utils.date_utils import to_local_time
+from app.utils.index_utils import declare_index, declare_query
+from config import Config
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+import pytz
+
+# Rollup theo (ngày, sản phẩm, phương thức thanh toán); product_id = None là dòng tổng của đơn hàng
+ROLLUP_KEYS = [('day', 1), ('product_id', 1), ('payment_method', 1)]
+# Chỉ đơn completed mới được tính doanh thu
+SALES_STATUS = 'completed'
+DAY_FORMAT = '%Y-%m-%d'
+REBUILD_COLLECTION = 'sales_daily_rebuild'
+# Tên handler rollup trong outbox (receipt '<event_id>:sales_daily')
+SALES_HANDLER = 'sales_daily'
+# Cờ trong settings khi đang dựng lại sales_daily; tự hết hạn nếu lần dựng bị chết giữa chừng
+REBUILD_FLAG_ID = 'sales_daily_rebuild'
+REBUILD_LEASE = timedelta(hours=1)
+
+declare_index('sales_daily', ROLLUP_KEYS, unique=True)
+declare_query('sales_by_day', 'sales_daily', {'day': {'$gte': '2024-01-01', '$lte': '2024-01-31'}})
+
+def sales_day(created_at, timezone=None):
+    """Ngày bán hàng theo múi giờ cửa hàng (created_at lưu UTC)"""
+    return to_local_time(created_at, timezone or Config.TIMEZONE).strftime(DAY_FORMAT)
+
+def record_order_sales(db, order, sign=1, session=None):
+    """Cộng (sign=1) hoặc trừ (sign=-1) một đơn hàng vào sales_daily bằng $inc upsert"""
+    day = sales_day(order['created_at'])
+    payment_method = order.get('payment_method', 'cash')
+
+    products = {}
+    for item in order['items']:
+        quantity, revenue = products.get(item['product_id'], (0, 0))
+        products[item['product_id']] = (quantity + item['quantity'], revenue + item['subtotal'])
+
+    operations = [
+        UpdateOne(
+            {'day': day, 'product_id': product_id, 'payment_method': payment_method},
+            {'$inc': {'orders': sign, 'quantity': sign * quantity, 'revenue': sign * revenue}},
+            upsert=True
+        )
+        for product_id, (quantity, revenue) in products.items()
+    ]
+    operations.append(UpdateOne(
+        {'day': day, 'product_id': None, 'payment_method': payment_method},
+        {'$inc': {
+            'orders': sign,
+            'quantity': sign * sum(quantity for quantity, _ in products.values()),
+            'revenue': sign * order['total'],
+            'tax': sign * order.get('tax', 0)
+        }},
+        upsert=True
+    ))
+    db.sales_daily.bulk_write(operations, ordered=False, session=session)
+
+def sales_rebuild_running(db, session=None) -> bool:
+    """sales_daily đang được dựng lại: handler rollup phải để event chờ"""
+    flag = {'_id': REBUILD_FLAG_ID, 'until': {'$gt': datetime.utcnow()}}
+    return db.settings.find_one(flag, {'_id': 1}, session=session) is not None
+
+def _day_range(day, timezone):
+    """Khoảng created_at (UTC) của một ngày bán hàng"""
+    local_tz = pytz.timezone(timezone)
+    start = datetime.strptime(day, DAY_FORMAT)
+    bounds = [local_tz.localize(value).astimezone(pytz.UTC).replace(tzinfo=None)
+              for value in (start, start + timedelta(days=1))]
+    return {'$gte': bounds[0], '$lt': bounds[1]}
+
+class ReportService:
+    def __init__(self, db, timezone=None):
+        self.db = db
+        self.timezone = timezone or Config.TIMEZONE
+
+    def get_sales(self, start_date, end_date, top=10):
+        """Doanh thu theo ngày, theo phương thức thanh toán và top sản phẩm, đọc từ sales_daily"""
+        for value in (start_date, end_date):
+            datetime.strptime(value, DAY_FORMAT)  # ValueError nếu sai định dạng
+        day_range = {'$gte': start_date, '$lte': end_date}
+
+        days = {}
+        payment_methods = {}
+        totals = {'orders': 0, 'quantity': 0, 'revenue': 0, 'tax': 0}
+        for row in self.db.sales_daily.find({'day': day_range, 'product_id': None}, {'_id': 0}):
+            day = days.setdefault(row['day'], {'day': row['day'], 'orders': 0, 'quantity': 0, 'revenue': 0})
+            method = payment_methods.setdefault(row['payment_method'], {
+                'payment_method': row['payment_method'], 'orders': 0, 'revenue': 0
+            })
+            for field in ('orders', 'quantity', 'revenue'):
+                day[field] += row.get(field, 0)
+            for field in ('orders', 'revenue'):
+                method[field] += row.get(field, 0)
+            for field in totals:
+                totals[field] += row.get(field, 0)
+
+        products = list(self.db.sales_daily.aggregate([
+            {'$match': {'day': day_range, 'product_id': {'$ne': None}}},
+            {'$group': {
+                '_id': '$product_id',
+                'orders': {'$sum': '$orders'},
+                'quantity': {'$sum': '$quantity'},
+                'revenue': {'$sum': '$revenue'}
+            }},
+            {'$sort': {'revenue': -1}},
+            {'$limit': top}
+        ]))
+        names = {
+            product['_id']: product.get('name')
+            for product in self.db.products.find({'_id': {'$in': [row['_id'] for row in products]}}, {'name': 1})
+        }
+
+        return {
+            'start_date': start_date,
+            'end_date': end_date,
+            'totals': totals,
+            'days': [days[day] for day in sorted(days)],
+            'payment_methods': sorted(payment_methods.values(), key=lambda row: -row['revenue']),
+            'top_products': [{
+                'product_id': row['_id'],
+                'name': names.get(row['_id']),
+                'orders': row['orders'],
+                'quantity': row['quantity'],
+                'revenue': row['revenue']
+            } for row in products]
+        }
+
+    def rebuild_sales_daily(self):
+        """Tính lại toàn bộ sales_daily từ orders (chạy lúc ít giao dịch).
+
+        Dựng vào collection tạm bằng $out/$merge rồi rename đè sales_daily, nên dashboard
+        không bao giờ thấy dữ liệu dở dang. Trong lúc dựng, handler rollup của outbox tạm dừng
+        nên không có $inc nào ghi vào sales_daily cũ rồi bị rename làm mất. Trước khi rename,
+        event chưa được rollup được đánh dấu đã xử lý và các ngày của chúng được tính lại từ
+        orders, lặp tới khi không còn event nào: event đến sau đó chỉ mang thay đổi chưa có
+        trong bản dựng và được cộng vào sales_daily mới như bình thường.
+        """
+        self.db.settings.update_one(
+            {'_id': REBUILD_FLAG_ID},
+            {'$set': {'until': datetime.utcnow() + REBUILD_LEASE}},
+            upsert=True
+        )
+        try:
+            rebuild = self.db[REBUILD_COLLECTION]
+            rebuild.drop()
+            rebuild.create_index(ROLLUP_KEYS, unique=True)
+            self._aggregate_sales({'status': SALES_STATUS}, {'$out': REBUILD_COLLECTION})
+
+            days = self._absorb_pending_sales()
+            while days:
+                rebuild.delete_many({'day': {'$in': days}})
+                self._aggregate_sales(
+                    {'status': SALES_STATUS, '$or': [{'created_at': _day_range(day, self.timezone)} for day in days]},
+                    {'$merge': {'into': REBUILD_COLLECTION, 'on': ['day', 'product_id', 'payment_method']}}
+                )
+                days = self._absorb_pending_sales()
+
+            rows = rebuild.count_documents({})
+            rebuild.rename('sales_daily', dropTarget=True)
+            return rows
+        finally:
+            self.db.settings.delete_one({'_id': REBUILD_FLAG_ID})
+
+    def _absorb_pending_sales(self):
+        """Ghi receipt rollup cho các event đơn hàng chưa được cộng vào sales_daily, trả về các ngày bị ảnh hưởng"""
+        from app.services.outbox_handlers import ORDER_COMPLETED, ORDER_REVERSED
+
+        days = set()
+        pending = self.db.outbox.find(
+            {'type': {'$in': [ORDER_COMPLETED, ORDER_REVERSED]}, 'status': {'$ne': 'done'}},
+            {'payload.order.created_at': 1}
+        )
+        for event in pending:
+            try:
+                self.db.outbox_receipts.insert_one(outbox_receipt(event['_id'], SALES_HANDLER))
+            except DuplicateKeyError:
+                continue  # Đã được rollup trước khi tạm dừng
+            days.add(sales_day(event['payload']['order']['created_at'], self.timezone))
+        return sorted(days)
+
+    def _aggregate_sales(self, match, output):
+        """Gom đơn hàng khớp `match` thành các dòng rollup và ghi vào collection tạm"""
+        day = {'$dateToString': {'format': DAY_FORMAT, 'date': '$created_at', 'timezone': self.timezone}}
+
+        # Dòng theo sản phẩm: gộp các dòng trùng sản phẩm trong cùng đơn trước khi đếm số đơn
+        self.db.orders.aggregate([
+            {'$match': match},
+            {'$unwind': '$items'},
+            {'$group': {
+                '_id': {'order': '$_id', 'product_id': '$items.product_id'},
+                'day': {'$first': day},
+                'payment_method': {'$first': '$payment_method'},
+                'quantity': {'$sum': '$items.quantity'},
+                'revenue': {'$sum': '$items.subtotal'}
+            }},
+            {'$group': {
+                '_id': {'day': '$day', 'product_id': '$_id.product_id', 'payment_method': '$payment_method'},
+                'orders': {'$sum': 1},
+                'quantity': {'$sum': '$quantity'},
+                'revenue': {'$sum': '$revenue'}
+            }},
+            {'$project': {
+                '_id': 0,
+                'day': '$_id.day',
+                'product_id': '$_id.product_id',
+                'payment_method': '$_id.payment_method',
+                'orders': 1,
+                'quantity': 1,
+                'revenue': 1
+            }},
+            output
+        ], allowDiskUse=True)
+
+        # Dòng tổng theo đơn hàng (product_id = None)
+        self.db.orders.aggregate([
+            {'$match': match},
+            {'$group': {
+                '_id': {'day': day, 'payment_method': '$payment_method'},
+                'orders': {'$sum': 1},
+                'quantity': {'$sum': {'$sum': '$items.quantity'}},
+                'revenue': {'$sum': '$total'},
+                'tax': {'$sum': '$tax'}
+            }},
+            {'$project': {
+                '_id': 0,
+                'day': '$_id.day',
+                'product_id': {'$literal': None},
+                'payment_method': '$_id.payment_method',
+                'orders': 1,
+                'quantity': 1,
+                'revenue': 1,
+                'tax': 1
+            }},
+            {'$merge': {'into': REBUILD_COLLECTION, 'on': ['day', 'product_id', 'payment_method']}}
+        ], allowDiskUse=True)
@@ -1,18 +1,23 @@
 from app.models.setting import Setting, ReceiptTemplate, PaymentConfig, StoreInfo, PrinterConfig
+from app.services.cache import cached, invalidates
 from datetime import datetime
 
 class SettingService:
-    def __init__(self, db_service):
+    def __init__(self, db_service, cache=None):
         self.db = db_service
+        self.cache = cache
         self.settings_id = 'global'
 
+    @cached('settings')
     def get_settings(self):
-        return self.db.find_one('settings', {'_id': self.settings_id})
+        return self.db.settings.find_one({'_id': self.settings_id})
 
+    @cached('settings')
     def get_receipt_settings(self):
-        settings = self.db.find_one('settings', {'_id': self.settings_id})
+        settings = self.db.settings.find_one({'_id': self.settings_id})
         return settings.get('receipt_template', {})
 
+    @invalidates('settings')
     def update_receipt_settings(self, data: dict):
         template = ReceiptTemplate(
             header=data.get('header'),
@@ -25,18 +30,19 @@ class SettingService:
             custom_fields=data.get('custom_fields', [])
         )
         
-        self.db.update_one(
-            'settings',
+        self.db.settings.update_one(
             {'_id': self.settings_id},
             {'$set': {'receipt_template': vars(template)}},
             upsert=True
         )
         return vars(template)
 
+    @cached('settings')
     def get_payment_settings(self):
-        settings = self.db.find_one('settings', {'_id': self.settings_id})
+        settings = self.db.settings.find_one({'_id': self.settings_id})
         return settings.get('payment_config', {})
 
+    @invalidates('settings')
     def update_payment_settings(self, data: dict):
         config = PaymentConfig(
             methods=data.get('methods', []),
@@ -45,18 +51,19 @@ class SettingService:
             default_method=data.get('default_method', 'cash')
         )
         
-        self.db.update_one(
-            'settings',
+        self.db.settings.update_one(
             {'_id': self.settings_id},
             {'$set': {'payment_config': vars(config)}},
             upsert=True
         )
         return vars(config)
 
+    @cached('settings')
     def get_store_settings(self):
-        settings = self.db.find_one('settings', {'_id': self.settings_id})
+        settings = self.db.settings.find_one({'_id': self.settings_id})
         return settings.get('store_info', {})
 
+    @invalidates('settings')
     def update_store_settings(self, data: dict):
         info = StoreInfo(
             name=data.get('name'),
@@ -68,18 +75,19 @@ class SettingService:
             working_hours=data.get('working_hours', {})
         )
         
-        self.db.update_one(
-            'settings',
+        self.db.settings.update_one(
             {'_id': self.settings_id},
             {'$set': {'store_info': vars(info)}},
             upsert=True
         )
         return vars(info)
 
+    @cached('settings')
     def get_printer_settings(self):
-        settings = self.db.find_one('settings', {'_id': self.settings_id})
+        settings = self.db.settings.find_one({'_id': self.settings_id})
         return settings.get('printer_config', {})
 
+    @invalidates('settings')
     def update_printer_settings(self, data: dict):
         config = PrinterConfig(
             type=data.get('type', 'thermal'),
@@ -91,18 +99,19 @@ class SettingService:
             dpi=data.get('dpi', 203)
         )
         
-        self.db.update_one(
-            'settings',
+        self.db.settings.update_one(
             {'_id': self.settings_id},
             {'$set': {'printer_config': vars(config)}},
             upsert=True
         )
         return vars(config)
 
+    @cached('settings')
     def get_config_settings(self):
-        settings = self.db.find_one('settings', {'_id': self.settings_id})
+        settings = self.db.settings.find_one({'_id': self.settings_id})
         return settings.get('config', {})
 
+    @invalidates('settings')
     def update_config_settings(self, data: dict):
         config = {
             'debug': data.get('debug', False),
@@ -116,8 +125,7 @@ class SettingService:
             'mail_settings': data.get('mail_settings', {})
         }
 
-        self.db.update_one(
-            'settings',
+        self.db.settings.update_one(
             {'_id': self.settings_id},
             {'$set': {'config': config}},
             upsert=True
@@ -0,0 +1,117 @@
+from app.utils.index_utils import declare_index
+from datetime import datetime, timezone
+from pymongo.errors import DuplicateKeyError
+import hashlib
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_CHANNEL = 'pos:auth:revoked'
+
+# _id là jti; Mongo tự xoá bản ghi khi token hết hạn
+declare_index('revoked_tokens', 'expires_at', expireAfterSeconds=0)
+
+def token_jti(token: str, claims: dict) -> str:
+    """jti của token; token cũ không có jti thì dùng digest của chính token"""
+    return claims.get('jti') or hashlib.sha256(token.encode()).hexdigest()
+
+class TokenRevocationList:
+    """Tập jti đã bị thu hồi trong bộ nhớ process, kiểm tra O(1) không cần truy vấn Mongo.
+
+    Nạp từ revoked_tokens khi khởi động, nhận jti mới từ các worker khác qua Redis pub/sub
+    và nạp lại định kỳ để bù message bị lỡ. Khi chưa start hoặc mất kết nối Redis thì tra thẳng
+    Mongo theo _id.
+    """
+
+    def __init__(self, db, redis=None, refresh_interval: float = 60):
+        self.db = db
+        self.redis = redis
+        self.refresh_interval = refresh_interval
+        self._revoked = None  # jti -> exp (epoch giây)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='token-revocation', daemon=True)
+            self._thread.start()
+        return self
+
+    def is_revoked(self, jti: str) -> bool:
+        revoked = self._revoked
+        if revoked is None:
+            return self.db.revoked_tokens.find_one({'_id': jti}, {'_id': 1}) is not None
+        return jti in revoked
+
+    def revoke(self, jti: str, exp: float):
+        expires_at = datetime.fromtimestamp(exp, tz=timezone.utc).replace(tzinfo=None)
+        try:
+            self.db.revoked_tokens.insert_one({
+                '_id': jti,
+                'expires_at': expires_at,
+                'revoked_at': datetime.utcnow()
+            })
+        except DuplicateKeyError:
+            pass
+        self._add(jti, exp)
+        if self.redis is not None:
+            try:
+                self.redis.publish(REVOCATION_CHANNEL, json.dumps({'jti': jti, 'exp': exp}))
+            except Exception as e:
+                logger.error(f"Publishing token revocation failed: {str(e)}")
+
+    def load(self):
+        """Nạp lại toàn bộ jti còn hạn từ database"""
+        now = datetime.utcnow()
+        revoked = {
+            doc['_id']: doc['expires_at'].replace(tzinfo=timezone.utc).timestamp()
+            for doc in self.db.revoked_tokens.find({'expires_at': {'$gt': now}}, {'expires_at': 1})
+        }
+        with self._lock:
+            self._revoked = revoked
+
+    def _add(self, jti: str, exp: float):
+        with self._lock:
+            if self._revoked is not None:
+                self._revoked[jti] = exp
+
+    def _run(self):
+        while True:
+            if self.redis is None:
+                try:
+                    self.load()
+                except Exception as e:
+                    logger.error(f"Loading revoked tokens failed: {str(e)}")
+                time.sleep(self.refresh_interval)
+                continue
+            try:
+                self._listen()
+            except Exception as e:
+                logger.error(f"Token revocation listener failed: {str(e)}")
+                # Mất pub/sub thì tập trong bộ nhớ không còn cập nhật: tra thẳng Mongo
+                # cho tới khi subscribe lại được (_listen nạp lại tập sau khi subscribe)
+                with self._lock:
+                    self._revoked = None
+                time.sleep(1)
+
+    def _listen(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(REVOCATION_CHANNEL)
+        try:
+            # Subscribe trước khi nạp để không lỡ jti thu hồi trong lúc nạp
+            self.load()
+            next_refresh = time.monotonic() + self.refresh_interval
+            while True:
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    data = json.loads(message['data'])
+                    self._add(data['jti'], data['exp'])
+                if time.monotonic() >= next_refresh:
+                    # Nạp lại cũng loại bỏ các jti đã hết hạn
+                    self.load()
+                    next_refresh = time.monotonic() + self.refresh_interval
+        finally:
+            pubsub.close()
@@ -2,10 +2,12 @@ from .jwt_utils import generate_token, verify_token
 from .password_utils import hash_password, verify_password
 from .query_utils import build_search_query
 from .pagination_utils import paginate_results
-from .order_utils import generate_order_number
+from .order_utils import OrderNumberGenerator, shared_order_number_generator
 from .money_utils import format_currency, calculate_total
 from .date_utils import format_date, parse_date
 from .validation_utils import validate_email, validate_phone
+from .serializer_utils import DocumentSerializer
+from .export_utils import iter_ndjson, iter_csv, gzip_stream
 
 __all__ = [
     'generate_token',
@@ -14,11 +16,16 @@ __all__ = [
     'verify_password',
     'build_search_query',
     'paginate_results',
-    'generate_order_number',
+    'OrderNumberGenerator',
+    'shared_order_number_generator',
     'format_currency',
     'calculate_total',
     'format_date',
     'parse_date',
     'validate_email',
-    'validate_phone'
+    'validate_phone',
+    'DocumentSerializer',
+    'iter_ndjson',
+    'iter_csv',
+    'gzip_stream'
 ]
@@ -1,25 +1,48 @@
 from functools import wraps
-from flask import request, current_app
+from flask import request, current_app, g
 import jwt
-from bson import ObjectId
+import hashlib
 import logging
-from app import mongo
+from app import mongo, token_revocations
+from app.services.token_revocation import token_jti
 
 logger = logging.getLogger(__name__)
 
+def verify_request_token(token: str) -> dict:
+    """Xác thực token qua cache; lỗi thì ném jwt.InvalidTokenError"""
+    keyset = current_app.extensions['jwt_keyset']
+    cache = current_app.extensions['jwt_verified_cache']
+    digest = hashlib.sha256(token.encode()).digest()
+
+    claims = cache.get(digest, keyset)
+    if claims is None:
+        claims = keyset.decode(token)
+        if 'exp' not in claims:
+            raise jwt.MissingRequiredClaimError('exp')
+        cache.put(digest, jwt.get_unverified_header(token).get('kid'), claims)
+    return claims
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        logger.debug(f"Using SECRET_KEY: {current_app.config['JWT_SECRET_KEY'][:5]}...")
-        auth_header = request.headers.get('Authorization')
-        token = auth_header.replace('Bearer ', '')
-        
+        auth_header = request.headers.get('Authorization', '')
+        if not auth_header.startswith('Bearer '):
+            return {'message': 'Unauthorized - Invalid or missing token'}, 401
+        token = auth_header[len('Bearer '):]
+
         try:
-            data = jwt.decode(token, current_app.config['JWT_SECRET_KEY'], algorithms=["HS256"])
-            logger.debug(f"Token decoded successfully: {data}")
-            return f(*args, **kwargs)
-        except jwt.InvalidSignatureError:
-            logger.error("Token signature verification failed")
-            return {'message': 'Invalid token signature'}, 401
+            data = verify_request_token(token)
+        except jwt.ExpiredSignatureError:
+            return {'message': 'Token has expired'}, 401
+        except jwt.InvalidTokenError as e:
+            logger.warning(f"Token verification failed: {e.__class__.__name__}")
+            return {'message': 'Invalid token'}, 401
+
+        # Kiểm tra trong bộ nhớ, không truy vấn Mongo
+        if token_revocations.is_revoked(token_jti(token, data)):
+            return {'message': 'Token has been revoked'}, 401
+        g.token = token
+        g.token_claims = data
+        return f(*args, **kwargs)
 
     return decorated
@@ -0,0 +1,41 @@
+import csv
+import io
+import zlib
+
+# Gom các dòng nhỏ thành chunk ~64KB trước khi ghi ra response
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+def iter_ndjson(rows, dumps):
+    """Encode từng document thành một dòng JSON; dumps trả về bytes"""
+    buffer = bytearray()
+    for row in rows:
+        buffer += dumps(row)
+        buffer += b'\n'
+        if len(buffer) >= EXPORT_CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+def iter_csv(rows, columns, flatten):
+    """Ghi CSV theo chunk; flatten(row) trả về danh sách các dòng (list giá trị theo columns)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerows(flatten(row))
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def gzip_stream(chunks, level=6):
+    """Nén gzip trên đường stream, không cần biết trước kích thước"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
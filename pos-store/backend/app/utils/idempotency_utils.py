@@ -0,0 +1,101 @@
+from flask import request, g, has_request_context
+from flask_restx import abort
+from functools import wraps
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from app.utils.index_utils import declare_index
+import hashlib
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_TTL = timedelta(hours=24)
+# Thời gian giữ quyền xử lý một key; quá hạn (worker chết giữa chừng) thì request sau được chạy lại
+IDEMPOTENCY_LEASE = timedelta(seconds=60)
+
+declare_index('idempotency', 'expires_at', expireAfterSeconds=0)
+
+def _fingerprint():
+    return hashlib.sha256(request.get_data()).hexdigest()
+
+def _normalize_response(result):
+    """Resource của flask-restx trả về data, (data, code) hoặc (data, code, headers)"""
+    if isinstance(result, tuple):
+        return result[0], result[1] if len(result) > 1 else 200
+    return result, 200
+
+def _claim(collection, key, fingerprint):
+    """Giành quyền xử lý key; trả về None nếu được chạy, ngược lại là record đã có"""
+    now = datetime.utcnow()
+    try:
+        collection.insert_one({
+            '_id': key,
+            'fingerprint': fingerprint,
+            'status': 'processing',
+            'locked_until': now + IDEMPOTENCY_LEASE,
+            'expires_at': now + IDEMPOTENCY_TTL
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+
+    # Request trước chết khi chưa commit: lấy lại lease và chạy lại
+    taken = collection.update_one(
+        {'_id': key, 'fingerprint': fingerprint, 'status': 'processing', 'locked_until': {'$lt': now}},
+        {'$set': {'locked_until': now + IDEMPOTENCY_LEASE}}
+    )
+    if taken.modified_count:
+        return None
+    return collection.find_one({'_id': key})
+
+def idempotent(db):
+    """Decorator cho POST: cùng Idempotency-Key và cùng body thì trả lại response đã lưu, không chạy lại.
+
+    Record nằm trong collection idempotency (TTL theo expires_at). run_in_transaction đánh dấu
+    record là committed trong cùng transaction với dữ liệu, nên khi retry sau crash không ghi trùng.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return fn(*args, **kwargs)
+
+            # Cùng key nhưng khác endpoint là hai request khác nhau
+            key = f'{request.method}:{request.path}:{key}'
+            fingerprint = _fingerprint()
+            existing = _claim(db.idempotency, key, fingerprint)
+            if existing is not None:
+                if existing.get('fingerprint') != fingerprint:
+                    abort(422, 'Idempotency-Key was already used with a different request body')
+                if existing.get('status') == 'completed':
+                    return existing['response'], existing['code'], {'Idempotent-Replayed': 'true'}
+                if existing.get('status') == 'committed':
+                    abort(409, 'Request was already processed')
+                abort(409, 'A request with this Idempotency-Key is still in progress')
+
+            g.idempotency_key = key
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                # Lỗi trước khi commit: xoá key để client có thể thử lại
+                db.idempotency.delete_one({'_id': key, 'status': 'processing'})
+                raise
+
+            data, code = _normalize_response(result)
+            if 200 <= code < 300:
+                db.idempotency.update_one(
+                    {'_id': key},
+                    {'$set': {'status': 'completed', 'response': data, 'code': code}}
+                )
+            else:
+                db.idempotency.delete_one({'_id': key, 'status': 'processing'})
+            return result
+        return wrapper
+    return decorator
+
+def mark_committed(db, session):
+    """Gọi trong transaction: đánh dấu Idempotency-Key của request hiện tại là đã commit"""
+    if not has_request_context():
+        return
+    key = g.get('idempotency_key')
+    if key:
+        db.idempotency.update_one({'_id': key}, {'$set': {'status': 'committed'}}, session=session)
@@ -0,0 +1,97 @@
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Các index do từng service khai báo: collection -> [(keys, options)]
+_INDEXES = {}
+# Các truy vấn chuẩn của từng service, dùng cho index advisor
+_QUERIES = []
+
+def _normalize_keys(keys):
+    if isinstance(keys, str):
+        return [(keys, ASCENDING)]
+    return [(field, direction) for field, direction in keys]
+
+def declare_index(collection: str, keys, **options):
+    """Khai báo index mà truy vấn của service cần (unique, expireAfterSeconds, ...)"""
+    keys = _normalize_keys(keys)
+    specs = _INDEXES.setdefault(collection, [])
+    if (keys, options) not in specs:
+        specs.append((keys, options))
+
+def declare_query(name: str, collection: str, query: dict, sort=None):
+    """Khai báo truy vấn chuẩn để advisor kiểm tra bằng explain()"""
+    _QUERIES.append({
+        'name': name,
+        'collection': collection,
+        'query': query,
+        'sort': _normalize_keys(sort) if sort else None
+    })
+
+def declared_indexes():
+    return {collection: list(specs) for collection, specs in _INDEXES.items()}
+
+def ensure_indexes(db) -> list:
+    """Tạo các index đã khai báo nhưng chưa có trong database"""
+    created = []
+    for collection, specs in _INDEXES.items():
+        try:
+            existing = {
+                tuple(info['key'])
+                for info in db[collection].index_information().values()
+            }
+        except OperationFailure as e:
+            logger.error(f"Cannot read indexes of {collection}: {str(e)}")
+            continue
+
+        for keys, options in specs:
+            if tuple(keys) in existing:
+                continue
+            try:
+                name = db[collection].create_index(keys, background=True, **options)
+                created.append((collection, name))
+                logger.info(f"Created index {collection}.{name}")
+            except OperationFailure as e:
+                logger.error(f"Cannot create index on {collection} {keys}: {str(e)}")
+    return created
+
+def ensure_indexes_in_background(db) -> threading.Thread:
+    """Đối chiếu và build index còn thiếu trên một thread riêng, không chặn lúc khởi động"""
+    thread = threading.Thread(
+        target=ensure_indexes,
+        args=(db,),
+        name='index-reconciler',
+        daemon=True
+    )
+    thread.start()
+    return thread
+
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+def advise_indexes(db) -> list:
+    """Chạy explain() cho từng truy vấn chuẩn và đánh dấu các truy vấn bị COLLSCAN"""
+    reports = []
+    for spec in _QUERIES:
+        cursor = db[spec['collection']].find(spec['query'])
+        if spec['sort']:
+            cursor = cursor.sort(spec['sort'])
+        try:
+            plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+        except OperationFailure as e:
+            reports.append({**spec, 'stages': [], 'collscan': None, 'error': str(e)})
+            continue
+
+        stages = list(_plan_stages(plan))
+        reports.append({**spec, 'stages': stages, 'collscan': 'COLLSCAN' in stages, 'error': None})
+    return reports
@@ -1,6 +1,7 @@
 from flask_pymongo import PyMongo
 from werkzeug.security import generate_password_hash
 from datetime import datetime
+from app.utils.index_utils import ensure_indexes_in_background
 
 def init_database(app, mongo):
     # Tạo các collections cần thiết
@@ -86,8 +87,9 @@ def init_database(app, mongo):
         ]
         mongo.db.categories.insert_many(default_categories)
 
-    # Tạo indexes
-    mongo.db.users.create_index('email', unique=True)
-    mongo.db.products.create_index('barcode', unique=True)
-    mongo.db.customers.create_index('phone', unique=True)
-    mongo.db.orders.create_index('order_number', unique=True)
+    # Tạo các index do services khai báo (build nền, không chặn khởi động)
+    ensure_indexes_in_background(mongo.db)
+
+    # Bổ sung token tìm kiếm cho sản phẩm cũ (chạy nền, chỉ sản phẩm còn thiếu)
+    from app.services.product_service import backfill_search_fields_in_background
+    backfill_search_fields_in_background(mongo.db)
@@ -1,18 +1,44 @@
+from flask import current_app, make_response
 from flask.json.provider import JSONProvider
-import json
-from datetime import datetime
-from bson import ObjectId
+from datetime import date, datetime
+import orjson
+
+# Key không phải str (vd. int) được chuyển thành chuỗi thay vì báo lỗi;
+# datetime đi qua _default để giữ định dạng cũ của API thay vì isoformat của orjson
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def _default(o):
+    # orjson tự xử lý dict/list/str/số; datetime, ObjectId, Decimal... đi qua đây
+    if isinstance(o, datetime):
+        return o.strftime(DATETIME_FORMAT)
+    if isinstance(o, date):
+        return o.isoformat()
+    # Như provider cũ: kiểu khác (ObjectId, Decimal, ...) được chuyển bằng str()
+    return str(o)
 
 class CustomJSONProvider(JSONProvider):
+    """JSON provider dùng orjson: datetime và ObjectId được encode trực tiếp,
+    nên route có thể trả về document BSON thô mà không cần format lại"""
+    mimetype = 'application/json'
+
+    def dumps_bytes(self, obj) -> bytes:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
     def dumps(self, obj, **kwargs):
-        def default(o):
-            if isinstance(o, datetime):
-                return o.strftime('%Y-%m-%d %H:%M:%S')
-            if isinstance(o, ObjectId):
-                return str(o)
-            return str(o)
-            
-        return json.dumps(obj, default=default, **kwargs)
+        return self.dumps_bytes(obj).decode()
 
     def loads(self, s, **kwargs):
-        return json.loads(s, **kwargs)
\ No newline at end of file
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Ghi thẳng bytes vào response, không qua chuỗi trung gian
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+def output_json(data, code, headers=None):
+    """Representation application/json cho flask-restx (mặc định restx dùng json của stdlib)"""
+    response = make_response(current_app.json.dumps_bytes(data), code)
+    response.headers.extend(headers or {})
+    response.mimetype = CustomJSONProvider.mimetype
+    return response
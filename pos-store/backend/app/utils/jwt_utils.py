@@ -1,15 +1,90 @@
 import jwt
 from datetime import datetime, timedelta
 from typing import Dict
+from collections import OrderedDict
+import threading
+import time
+import uuid
 
-def generate_token(user: Dict, secret_key: str, expiry_hours: int = 24) -> str:
+def generate_token(user: Dict, secret_key: str, expiry_hours: int = 24, kid: str = None) -> str:
     payload = {
         'user_id': str(user['_id']),
         'email': user['email'],
         'role': user['role'],
+        'jti': uuid.uuid4().hex,
         'exp': datetime.utcnow() + timedelta(hours=expiry_hours)
     }
-    return jwt.encode(payload, secret_key, algorithm='HS256')
+    headers = {'kid': kid} if kid else None
+    return jwt.encode(payload, secret_key, algorithm='HS256', headers=headers)
 
 def verify_token(token: str, secret_key: str) -> Dict:
     return jwt.decode(token, secret_key, algorithms=['HS256'])
+
+class JWTKeySet:
+    """Các khoá ký JWT theo kid để xoay khoá: token mới ký bằng khoá active,
+    token cũ vẫn hợp lệ khi kid của nó còn trong tập. Token không có kid dùng default_key;
+    accept_unkeyed=False (khi đã có keys) thì từ chối các token đó để gỡ hẳn khoá cũ."""
+
+    def __init__(self, keys: Dict[str, str], active_kid: str = None, default_key: str = None,
+                 accept_unkeyed: bool = True):
+        self.keys = dict(keys)
+        self.active_kid = active_kid if active_kid in self.keys else next(iter(self.keys), None)
+        # Chưa có keys thì mọi token đều ký bằng default_key, luôn phải chấp nhận
+        self.default_key = default_key if accept_unkeyed or not self.keys else None
+
+    @classmethod
+    def from_config(cls, config):
+        # JWT_SIGNING_KEYS = "kid1:secret1,kid2:secret2"
+        keys = {}
+        for entry in (config.get('JWT_SIGNING_KEYS') or '').split(','):
+            kid, _, secret = entry.strip().partition(':')
+            if kid and secret:
+                keys[kid] = secret
+        return cls(keys, config.get('JWT_ACTIVE_KID'), config.get('JWT_SECRET_KEY'),
+                   accept_unkeyed=config.get('JWT_ACCEPT_UNKEYED_TOKENS', True))
+
+    def has_kid(self, kid: str) -> bool:
+        return kid in self.keys if kid else self.default_key is not None
+
+    def generate_token(self, user: Dict, expiry_hours: int = 24) -> str:
+        if self.active_kid:
+            return generate_token(user, self.keys[self.active_kid], expiry_hours, kid=self.active_kid)
+        return generate_token(user, self.default_key, expiry_hours)
+
+    def decode(self, token: str) -> Dict:
+        kid = jwt.get_unverified_header(token).get('kid')
+        key = self.keys.get(kid) if kid else self.default_key
+        if key is None:
+            raise jwt.InvalidTokenError('Unknown signing key')
+        return jwt.decode(token, key, algorithms=['HS256'])
+
+class VerifiedTokenCache:
+    """LRU các claims đã xác thực, key là digest của token và hết hạn theo exp của token.
+
+    Mỗi token chỉ phải chạy jwt.decode (HMAC + parse) một lần; các request sau chỉ tốn một sha256.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # digest -> (exp, kid, claims)
+        self._lock = threading.Lock()
+
+    def get(self, digest: bytes, keyset):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            exp, kid, claims = entry
+            # Hết hạn, hoặc khoá ký đã bị gỡ khỏi keyset
+            if exp <= time.time() or not keyset.has_kid(kid):
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return claims
+
+    def put(self, digest: bytes, kid, claims: dict):
+        with self._lock:
+            self._entries[digest] = (claims['exp'], kid, claims)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
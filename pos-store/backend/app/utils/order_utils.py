@@ -1,5 +1,55 @@
-from datetime import datetime
+from pymongo import ReturnDocument
+import os
+import threading
 
-def generate_order_number():
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    return f'ORD{timestamp}'
+ORDER_NUMBER_COUNTER_ID = 'order_number'
+ORDER_NUMBER_BLOCK_SIZE = 1000
+
+_shared_generators = {}
+_shared_lock = threading.Lock()
+
+class OrderNumberGenerator:
+    """Cấp số đơn hàng từ các khối dãy số dành trước trong collection counters.
+
+    Mỗi process giữ một khối block_size số, chỉ gọi MongoDB khi dùng hết khối, nên số đơn
+    luôn duy nhất giữa các worker và tăng dần trong từng worker. Dùng shared_order_number_generator
+    để mọi OrderService trong process lấy số từ cùng một khối.
+    """
+
+    def __init__(self, db, block_size=ORDER_NUMBER_BLOCK_SIZE, prefix='ORD', width=10):
+        self.db = db
+        self.block_size = block_size
+        self.prefix = prefix
+        self.width = width
+        self._next = 1
+        self._end = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def next(self) -> str:
+        with self._lock:
+            # Worker fork từ process cha không được dùng lại khối của process cha
+            if self._next > self._end or self._pid != os.getpid():
+                self._reserve()
+            number = self._next
+            self._next += 1
+        return f'{self.prefix}{number:0{self.width}d}'
+
+    def _reserve(self):
+        counter = self.db.counters.find_one_and_update(
+            {'_id': ORDER_NUMBER_COUNTER_ID},
+            {'$inc': {'seq': self.block_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._end = counter['seq']
+        self._next = self._end - self.block_size + 1
+        self._pid = os.getpid()
+
+def shared_order_number_generator(db) -> OrderNumberGenerator:
+    """Generator dùng chung trong process cho mỗi database"""
+    with _shared_lock:
+        generator = _shared_generators.get(db.name)
+        if generator is None:
+            generator = _shared_generators[db.name] = OrderNumberGenerator(db)
+        return generator
@@ -0,0 +1,33 @@
+import re
+import unicodedata
+
+MAX_PREFIX_LENGTH = 15
+_WORD_RE = re.compile(r'\w+')
+
+def fold_accents(text: str) -> str:
+    """Bỏ dấu tiếng Việt và chuyển về chữ thường ("Cà Phê" -> "ca phe")"""
+    if not text:
+        return ''
+    text = text.replace('đ', 'd').replace('Đ', 'D')
+    decomposed = unicodedata.normalize('NFD', text)
+    return ''.join(ch for ch in decomposed if unicodedata.category(ch) != 'Mn').lower()
+
+def tokenize(text: str) -> list:
+    """Tách chuỗi đã bỏ dấu thành các từ, cắt theo độ dài prefix tối đa"""
+    return [word[:MAX_PREFIX_LENGTH] for word in _WORD_RE.findall(fold_accents(text))]
+
+def prefix_tokens(text: str) -> list:
+    """Sinh tập prefix của từng từ, dùng cho tìm kiếm theo từng phím gõ"""
+    tokens = set()
+    for word in tokenize(text):
+        tokens.update(word[:length] for length in range(1, len(word) + 1))
+    return sorted(tokens)
+
+def build_search_fields(name: str, description: str = None) -> dict:
+    """Các field phục vụ tìm kiếm lưu kèm trong document sản phẩm"""
+    name_tokens = prefix_tokens(name)
+    return {
+        'search_name': fold_accents(name),
+        'name_tokens': name_tokens,
+        'search_tokens': sorted(set(name_tokens).union(prefix_tokens(description)))
+    }
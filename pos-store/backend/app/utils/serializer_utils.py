@@ -0,0 +1,51 @@
+from datetime import datetime
+from bson import ObjectId
+
+# Bảng chuyển đổi theo kiểu dữ liệu BSON -> JSON
+_CONVERTERS = {
+    ObjectId: str,
+    datetime: datetime.isoformat
+}
+
+def convert_value(value):
+    """Chuyển ObjectId/datetime sang string, giữ nguyên các kiểu khác"""
+    converter = _CONVERTERS.get(type(value))
+    return converter(value) if converter else value
+
+class DocumentSerializer:
+    """Serializer biên dịch sẵn từ danh sách field, chuyển đổi document trong một lượt duyệt"""
+
+    def __init__(self, fields, defaults=None, nested=None):
+        self.fields = tuple(fields)
+        self.defaults = defaults or {}
+        self.nested = nested or {}
+        self.projection = {field: 1 for field in self.fields}
+        self.serialize = self._compile()
+
+    def _compile(self):
+        # Sinh một hàm phẳng cho đúng danh sách field, tránh vòng lặp và tra cứu lúc chạy
+        namespace = {'_converter': _CONVERTERS.get}
+        lines = ['def serialize(doc):', '    get = doc.get']
+        for index, field in enumerate(self.fields):
+            namespace[f'_default{index}'] = self.defaults.get(field)
+            lines.append(f'    v{index} = get({field!r}, _default{index})')
+            if field in self.nested:
+                namespace[f'_nested{index}'] = self.nested[field].serialize
+                lines.append(
+                    f'    if v{index} is not None: v{index} = [_nested{index}(item) for item in v{index}]'
+                )
+            else:
+                lines.append(f'    c = _converter(type(v{index}))')
+                lines.append(f'    if c is not None: v{index} = c(v{index})')
+        items = ', '.join(f'{field!r}: v{index}' for index, field in enumerate(self.fields))
+        lines.append(f'    return {{{items}}}')
+
+        exec('\n'.join(lines), namespace)
+        return namespace['serialize']
+
+    def serialize_many(self, docs):
+        return list(map(self.serialize, docs))
+
+    def iter_serialize(self, docs):
+        """Chế độ streaming: serialize lần lượt từng document từ cursor"""
+        return map(self.serialize, docs)
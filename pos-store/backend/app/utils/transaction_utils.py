@@ -0,0 +1,14 @@
+from app.utils.idempotency_utils import mark_committed
+
+def run_in_transaction(db, callback):
+    """Chạy callback(session) trong một transaction MongoDB, tự retry khi gặp lỗi tạm thời.
+
+    Idempotency-Key của request hiện tại (nếu có) được đánh dấu committed trong cùng transaction.
+    """
+    def run(session):
+        result = callback(session)
+        mark_committed(db, session)
+        return result
+
+    with db.client.start_session() as session:
+        return session.with_transaction(run)
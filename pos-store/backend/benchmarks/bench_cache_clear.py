@@ -0,0 +1,94 @@
+"""Benchmark: độ trễ Redis trong lúc xoá cache của một namespace có 1 triệu key.
+
+Một thread đo độ trễ PING liên tục trong khi lần lượt chạy:
+  1. KEYS + DEL (cách cũ của CacheService.clear)
+  2. SCAN + UNLINK theo lô (CacheService.clear hiện tại, cho pattern cũ)
+  3. Tăng generation (CacheService.invalidate)
+
+    REDIS_HOST=localhost python benchmarks/bench_cache_clear.py [--keys 1000000]
+
+Chỉ chạy trên Redis dùng riêng cho benchmark: script ghi và xoá key pos:v1:bench:*.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.cache import CacheService  # noqa: E402
+
+NAMESPACE = 'bench'
+
+
+def populate(cache, count):
+    pipeline = cache.redis.pipeline(transaction=False)
+    for i in range(count):
+        # Ghi cả key theo pattern cũ lẫn key theo generation hiện tại
+        pipeline.set(cache.make_key(NAMESPACE, 'item', i), 'x', ex=3600)
+        if i % 10000 == 9999:
+            pipeline.execute()
+    pipeline.execute()
+
+
+def measure_latency(cache, operation):
+    samples = []
+    stop = threading.Event()
+
+    def probe():
+        while not stop.is_set():
+            start = time.perf_counter()
+            cache.redis.ping()
+            samples.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=probe)
+    thread.start()
+    time.sleep(0.2)
+    start = time.perf_counter()
+    operation()
+    elapsed = time.perf_counter() - start
+    time.sleep(0.2)
+    stop.set()
+    thread.join()
+
+    samples.sort()
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    return elapsed, statistics.median(samples), p99, samples[-1]
+
+
+def legacy_clear(cache):
+    keys = cache.redis.keys(cache.make_key(NAMESPACE, '*'))
+    if keys:
+        cache.redis.delete(*keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keys', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    cache = CacheService({
+        'REDIS_HOST': os.getenv('REDIS_HOST', 'localhost'),
+        'REDIS_PORT': int(os.getenv('REDIS_PORT', 6379)),
+        'REDIS_DB': int(os.getenv('REDIS_DB', 0))
+    })
+
+    cases = [
+        ('KEYS + DEL', lambda: legacy_clear(cache)),
+        ('SCAN + UNLINK', lambda: cache.clear(cache.make_key(NAMESPACE, '*'))),
+        ('generation bump', lambda: cache.invalidate(NAMESPACE)),
+    ]
+    print(f"{'strategy':<18}{'clear (s)':>10}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for label, operation in cases:
+        populate(cache, args.keys)
+        elapsed, p50, p99, worst = measure_latency(cache, operation)
+        print(f'{label:<18}{elapsed:>10.2f}{p50:>9.2f}{p99:>9.2f}{worst:>9.2f}')
+
+    cache.clear(cache.make_key(NAMESPACE, '*'))
+
+
+if __name__ == '__main__':
+    main()
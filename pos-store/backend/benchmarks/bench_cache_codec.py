@@ -0,0 +1,100 @@
+"""Micro-benchmark: kích thước và thời gian encode/decode một trang sản phẩm trong cache.
+
+So sánh json.dumps/json.loads cũ với CacheCodec (msgpack, JSON gắn kiểu; có/không nén).
+Mặc định sinh trang sản phẩm giống kết quả get_products; dùng --mongo-uri để lấy trang thật.
+
+    python benchmarks/bench_cache_codec.py [--products 50] [--pages 200] [--mongo-uri mongodb://...]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.cache_codec import CacheCodec, msgpack  # noqa: E402
+from app.services.product_service import PRODUCT_SERIALIZER  # noqa: E402
+
+
+def make_page(count):
+    now = datetime.utcnow()
+    products = [{
+        '_id': ObjectId(),
+        'name': f'Sản phẩm mẫu số {i}',
+        'description': 'Mô tả sản phẩm dùng cho benchmark cache, độ dài tương đương dữ liệu thật.',
+        'barcode': f'893{i:010d}',
+        'price': 25000.0 + i,
+        'cost_price': 18000.0 + i,
+        'stock_quantity': 100 + i,
+        'category_id': ObjectId(),
+        'unit': 'cái',
+        'image_url': f'/static/uploads/products/{i}.jpg',
+        'is_active': True,
+        'min_stock_level': 10,
+        'max_stock_level': 500,
+        'created_at': now - timedelta(days=i),
+        'updated_at': now
+    } for i in range(count)]
+    return {
+        'products': PRODUCT_SERIALIZER.serialize_many(products),
+        'total': count * 20,
+        'page': 1,
+        'limit': count,
+        'total_pages': 20
+    }
+
+
+def load_page(uri, count):
+    from pymongo import MongoClient
+    db = MongoClient(uri).get_default_database()
+    products = list(db.products.find({}, PRODUCT_SERIALIZER.projection).limit(count))
+    return {
+        'products': PRODUCT_SERIALIZER.serialize_many(products),
+        'total': db.products.estimated_document_count(),
+        'page': 1,
+        'limit': count,
+        'total_pages': 1
+    }
+
+
+def measure(label, encode, decode, page, pages):
+    data = encode(page)
+    start = time.perf_counter()
+    for _ in range(pages):
+        encode(page)
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(pages):
+        decode(data)
+    decode_time = time.perf_counter() - start
+    print(f'{label:<24} {len(data):>9,} bytes  encode {encode_time / pages * 1e6:>8.1f} us  '
+          f'decode {decode_time / pages * 1e6:>8.1f} us')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--mongo-uri')
+    args = parser.parse_args()
+
+    page = load_page(args.mongo_uri, args.products) if args.mongo_uri else make_page(args.products)
+
+    measure('before (json)', lambda v: json.dumps(v).encode(), json.loads, page, args.pages)
+    names = ['json', 'msgpack'] if msgpack is not None else ['json']
+    for name in names:
+        for threshold in (0, 1024):
+            codec = CacheCodec(name, compress_threshold=threshold)
+            assert codec.decode(codec.encode(page)) == page
+            label = f'after ({name}{", zlib" if threshold else ""})'
+            measure(label, codec.encode, codec.decode, page, args.pages)
+    if msgpack is None:
+        print('msgpack chưa được cài, bỏ qua codec msgpack')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Micro-benchmark: thời gian encode response /api/orders với 1000 đơn hàng.
+
+So sánh đường cũ (ORDER_SERIALIZER + json.dumps của stdlib như output_json mặc định
+của flask-restx) với CustomJSONProvider dùng orjson, trên dict đã format và document thô
+(document thô: datetime theo định dạng '%Y-%m-%d %H:%M:%S' của provider, không phải isoformat).
+
+    python benchmarks/bench_json_provider.py [--orders 1000] [--items 5] [--rounds 20]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.order_service import ORDER_SERIALIZER  # noqa: E402
+from app.utils.json_encoder import CustomJSONProvider  # noqa: E402
+from bench_order_serializer import make_orders  # noqa: E402
+
+
+def measure(label, fn, orders, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        body = fn(orders)
+        best = min(best, time.perf_counter() - start)
+    print(f'{label:<34} {best * 1000:>8.2f} ms/response  {len(body):>10,} bytes')
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--items', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    provider = CustomJSONProvider(Flask(__name__))
+    orders = make_orders(args.orders, args.items)
+
+    def page(order_list):
+        return {'orders': order_list, 'total': len(orders), 'page': 1, 'pages': 1}
+
+    serialized = page(ORDER_SERIALIZER.serialize_many(orders))
+    assert json.loads(provider.dumps_bytes(serialized)) == json.loads(json.dumps(serialized))
+
+    before = measure('before (serializer + json.dumps)',
+                     lambda docs: (json.dumps(page(ORDER_SERIALIZER.serialize_many(docs))) + '\n').encode(),
+                     orders, args.rounds)
+    measure('after (serializer + orjson)',
+            lambda docs: provider.dumps_bytes(page(ORDER_SERIALIZER.serialize_many(docs))), orders, args.rounds)
+    after = measure('after (raw documents + orjson)',
+                    lambda docs: provider.dumps_bytes(page(docs)), orders, args.rounds)
+    print(f'speedup (raw documents): {before / after:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Micro-benchmark: gửi email xác thực qua SMTP stand-in cục bộ (aiosmtpd, cần pip install aiosmtpd).
+
+So sánh cách cũ (mỗi thư một kết nối SMTP qua mail.send) với MailService.send (kết nối giữ theo
+thread, cách outbox worker gửi email xác thực): thời gian gửi mỗi thư và tổng thời gian để toàn bộ
+thư tới server.
+
+    python benchmarks/bench_mail_queue.py [--messages 200] [--port 8025]
+"""
+import argparse
+import os
+import sys
+import time
+
+from aiosmtpd.controller import Controller
+from flask import Flask
+from flask_mail import Mail
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.mail_service import MailService  # noqa: E402
+
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 OK'
+
+
+def make_app(port):
+    app = Flask(__name__)
+    app.config.update(
+        MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_TLS=False, MAIL_USE_SSL=False,
+        MAIL_USERNAME=None, MAIL_PASSWORD=None, MAIL_DEFAULT_SENDER='pos@localhost',
+        HOSTNAME='http://localhost:5000'
+    )
+    return app
+
+
+def wait_for(handler, count, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while handler.received < count and time.perf_counter() < deadline:
+        time.sleep(0.01)
+
+
+def run(label, send, app, handler, messages):
+    handler.received = 0
+    with app.app_context():
+        app.config['MAIL_USERNAME'] = 'pos@localhost'
+        start = time.perf_counter()
+        for i in range(messages):
+            send('Xác thực tài khoản', [f'user{i}@example.com'], f'<a href="/verify/token-{i}">Xác thực</a>')
+        request_time = time.perf_counter() - start
+    wait_for(handler, messages)
+    total = time.perf_counter() - start
+    print(f'{label:<24} request {request_time / messages * 1000:>8.3f} ms/mail  '
+          f'delivered {handler.received}/{messages} in {total:.2f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+
+    handler = CountingHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=args.port)
+    controller.start()
+    try:
+        app = make_app(args.port)
+        mail = Mail(app)
+        run('before (connection/mail)', lambda subject, recipients, html: mail.send(MailService._build_message({
+            'subject': subject, 'sender': 'pos@localhost', 'recipients': recipients, 'html': html
+        })), app, handler, args.messages)
+        run('after (kept connection)', MailService(mail).send, app, handler, args.messages)
+    finally:
+        controller.stop()
+
+
+if __name__ == '__main__':
+    main()
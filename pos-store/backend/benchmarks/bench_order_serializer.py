@@ -0,0 +1,104 @@
+"""Micro-benchmark: số đơn hàng serialize được mỗi giây cho trang 10k đơn.
+
+So sánh cách format thủ công cũ (dict + list comprehension + isoformat)
+với ORDER_SERIALIZER dùng chung trong OrderService.
+
+    python benchmarks/bench_order_serializer.py [--orders 10000] [--items 5] [--rounds 5]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.order_service import ORDER_SERIALIZER  # noqa: E402
+
+
+def legacy_format(order):
+    return {
+        '_id': str(order['_id']),
+        'order_number': order['order_number'],
+        'customer_id': str(order['customer_id']) if order.get('customer_id') else None,
+        'items': [{
+            'product_id': str(item['product_id']),
+            'name': item['name'],
+            'price': item['price'],
+            'quantity': item['quantity'],
+            'discount': item.get('discount', 0),
+            'subtotal': item['subtotal']
+        } for item in order['items']],
+        'subtotal': order['subtotal'],
+        'tax': order['tax'],
+        'total': order['total'],
+        'payment_method': order['payment_method'],
+        'status': order['status'],
+        'notes': order.get('notes'),
+        'created_by': str(order['created_by']) if order.get('created_by') else None,
+        'created_at': order['created_at'].isoformat(),
+        'updated_at': order['updated_at'].isoformat()
+    }
+
+
+def make_orders(count, items_per_order):
+    now = datetime.utcnow()
+    orders = []
+    for i in range(count):
+        items = [{
+            'product_id': ObjectId(),
+            'name': f'Sản phẩm {j}',
+            'price': 25000.0,
+            'quantity': j + 1,
+            'discount': 0.0,
+            'subtotal': 25000.0 * (j + 1)
+        } for j in range(items_per_order)]
+        subtotal = sum(item['subtotal'] for item in items)
+        orders.append({
+            '_id': ObjectId(),
+            'order_number': f'ORD{i:012d}',
+            'customer_id': ObjectId() if i % 3 else None,
+            'items': items,
+            'subtotal': subtotal,
+            'tax': 0,
+            'total': subtotal,
+            'payment_method': 'cash',
+            'status': 'completed',
+            'notes': None,
+            'created_by': ObjectId(),
+            'created_at': now - timedelta(minutes=i),
+            'updated_at': now - timedelta(minutes=i)
+        })
+    return orders
+
+
+def measure(label, fn, orders, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(orders)
+        best = min(best, time.perf_counter() - start)
+    print(f'{label:<28} {len(orders) / best:>12,.0f} orders/s  ({best * 1000:.1f} ms/page)')
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--items', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    orders = make_orders(args.orders, args.items)
+    assert [legacy_format(o) for o in orders[:100]] == ORDER_SERIALIZER.serialize_many(orders[:100])
+
+    before = measure('before (hand formatted)', lambda docs: [legacy_format(o) for o in docs], orders, args.rounds)
+    after = measure('after (ORDER_SERIALIZER)', ORDER_SERIALIZER.serialize_many, orders, args.rounds)
+    measure('after (streaming)', lambda docs: sum(1 for _ in ORDER_SERIALIZER.iter_serialize(docs)), orders, args.rounds)
+    print(f'speedup: {before / after:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
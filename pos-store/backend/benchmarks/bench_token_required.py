@@ -0,0 +1,96 @@
+"""Micro-benchmark: số request xác thực (route no-op) mỗi giây qua token_required.
+
+So sánh cách cũ (jwt.decode HS256 ở mọi request) với cache claims đã xác thực
+theo digest của token. Dùng Flask test client, không cần MongoDB/Redis.
+
+    python benchmarks/bench_token_required.py [--requests 20000] [--tokens 50]
+"""
+import argparse
+import os
+import sys
+import time
+from functools import wraps
+
+import jwt
+from bson import ObjectId
+from flask import Flask, request, current_app
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_package  # noqa: E402
+from app.utils.jwt_utils import JWTKeySet, VerifiedTokenCache  # noqa: E402
+
+
+class NoRevocations:
+    def is_revoked(self, jti):
+        return False
+
+
+# token_required đọc danh sách thu hồi từ app lúc import
+app_package.token_revocations = NoRevocations()
+from app.utils.auth_utils import token_required  # noqa: E402
+
+
+def legacy_token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers.get('Authorization').replace('Bearer ', '')
+        try:
+            jwt.decode(token, current_app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
+            return f(*args, **kwargs)
+        except jwt.InvalidSignatureError:
+            return {'message': 'Invalid token signature'}, 401
+    return decorated
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config.update(JWT_SECRET_KEY='bench-secret', JWT_SIGNING_KEYS='k1:bench-key-1,k2:bench-key-2',
+                      JWT_ACTIVE_KID='k2')
+    app.extensions['jwt_keyset'] = JWTKeySet.from_config(app.config)
+    app.extensions['jwt_verified_cache'] = VerifiedTokenCache()
+
+    @app.route('/before')
+    @legacy_token_required
+    def before():
+        return {}
+
+    @app.route('/after')
+    @token_required
+    def after():
+        return {}
+
+    return app
+
+
+def measure(label, client, path, tokens, count):
+    start = time.perf_counter()
+    for i in range(count):
+        response = client.get(path, headers={'Authorization': f'Bearer {tokens[i % len(tokens)]}'})
+        assert response.status_code == 200, response.data
+    elapsed = time.perf_counter() - start
+    print(f'{label:<24} {count / elapsed:>10,.0f} req/s')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--tokens', type=int, default=50)
+    args = parser.parse_args()
+
+    app = make_app()
+    client = app.test_client()
+    users = [{'_id': ObjectId(), 'email': f'user{i}@example.com', 'role': 'user'} for i in range(args.tokens)]
+    with app.app_context():
+        legacy_tokens = [jwt.encode({'user_id': str(u['_id']), 'exp': time.time() + 3600}, 'bench-secret',
+                                    algorithm='HS256') for u in users]
+        tokens = [app.extensions['jwt_keyset'].generate_token(u) for u in users]
+
+    before = measure('before (decode always)', client, '/before', legacy_tokens, args.requests)
+    after = measure('after (verified cache)', client, '/after', tokens, args.requests)
+    print(f'speedup: {before / after:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -26,11 +26,40 @@ class Config:
     # Cache Config  
     CACHE_TYPE = os.getenv('CACHE_TYPE', 'simple')
     CACHE_DEFAULT_TIMEOUT = int(os.getenv('CACHE_DEFAULT_TIMEOUT', 300))
+    CACHE_L1_MAX_ENTRIES = int(os.getenv('CACHE_L1_MAX_ENTRIES', 0))
+    CACHE_L1_MAX_BYTES = int(os.getenv('CACHE_L1_MAX_BYTES', 16 * 1024 * 1024))
+    CACHE_L1_TTL = int(os.getenv('CACHE_L1_TTL', 30))
+    CACHE_CODEC = os.getenv('CACHE_CODEC', 'msgpack')  # msgpack | json
+    CACHE_COMPRESS_THRESHOLD = int(os.getenv('CACHE_COMPRESS_THRESHOLD', 1024))
+    CACHE_STALE_TTL = int(os.getenv('CACHE_STALE_TTL', 60))  # giây trả dữ liệu cũ trong lúc làm mới
+    CACHE_LOCK_TIMEOUT = float(os.getenv('CACHE_LOCK_TIMEOUT', 5))
+    CACHE_EARLY_REFRESH_BETA = float(os.getenv('CACHE_EARLY_REFRESH_BETA', 1.0))
 
     # JWT Config
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-jwt-secret') 
     JWT_ACCESS_TOKEN_EXPIRES = int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 24 * 60 * 60))
+    # Xoay khoá: "kid1:secret1,kid2:secret2"; token mới ký bằng JWT_ACTIVE_KID (mặc định kid đầu tiên)
+    JWT_SIGNING_KEYS = os.getenv('JWT_SIGNING_KEYS', '')
+    JWT_ACTIVE_KID = os.getenv('JWT_ACTIVE_KID')
+    # Tắt (false) sau khi token ký bằng JWT_SECRET_KEY (không có kid) đã hết hạn để gỡ hẳn khoá cũ
+    JWT_ACCEPT_UNKEYED_TOKENS = os.getenv('JWT_ACCEPT_UNKEYED_TOKENS', 'true').lower() == 'true'
+    JWT_VERIFIED_CACHE_SIZE = int(os.getenv('JWT_VERIFIED_CACHE_SIZE', 10000))
+    TOKEN_REVOCATION_REFRESH = int(os.getenv('TOKEN_REVOCATION_REFRESH', 60))  # giây nạp lại danh sách thu hồi
+    # Hash mật khẩu chạy trong process pool; method theo werkzeug, vd. 'scrypt:32768:8:1', 'pbkdf2:sha256:600000'
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))  # 0 = hash ngay trên thread request
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 16))  # quá số này thì trả 429
+    # Số reverse proxy tin cậy đứng trước app; > 0 thì lấy IP client từ X-Forwarded-For (ProxyFix)
+    TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', 0))
+    # App đứng sau reverse proxy: bắt buộc có TRUSTED_PROXY_COUNT, nếu không app từ chối khởi động
+    BEHIND_PROXY = os.getenv('BEHIND_PROXY', 'false').lower() == 'true'
+    # Giới hạn đăng nhập: tối đa N lần thử trong LOGIN_RATE_WINDOW giây, theo IP và theo email (0 = tắt)
+    LOGIN_RATE_WINDOW = int(os.getenv('LOGIN_RATE_WINDOW', 300))
+    LOGIN_RATE_LIMIT_IP = int(os.getenv('LOGIN_RATE_LIMIT_IP', 50))
+    LOGIN_RATE_LIMIT_EMAIL = int(os.getenv('LOGIN_RATE_LIMIT_EMAIL', 10))
+    # Ghi log chẩn đoán truy vấn danh mục trên thread nền (chỉ bật khi cần điều tra)
+    CATEGORY_DIAGNOSTICS = os.getenv('CATEGORY_DIAGNOSTICS', 'false').lower() == 'true'
 
     # Mail Config
     MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
@@ -39,6 +68,10 @@ class Config:
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD', 'password')
     MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', 'true')
     MAIL_DEBUG = os.getenv('MAIL_DEBUG', 'False')
+    MAIL_IDLE_TIMEOUT = int(os.getenv('MAIL_IDLE_TIMEOUT', 5))  # giây giữ kết nối SMTP giữa các thư
+
+    # Outbox worker (0 = không chạy pool trong process này, dùng `flask outbox drain`)
+    OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 2))
 
     REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
     REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
@@ -0,0 +1,107 @@
+"""Gửi email và lỗi được raise cho outbox retry, qua SMTP server cục bộ (aiosmtpd).
+
+    pip install aiosmtpd pytest && python -m pytest tests
+"""
+import os
+import socket
+import sys
+
+import pytest
+
+controller_module = pytest.importorskip('aiosmtpd.controller')
+
+from flask import Flask  # noqa: E402
+from flask_mail import Mail  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.mail_service import MailService  # noqa: E402
+
+
+class FlakyHandler:
+    """Trả 451 cho `failures` thư đầu tiên rồi nhận các thư sau"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.received = []
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.failures > 0:
+            self.failures -= 1
+            return '451 Temporary failure'
+        self.received.append(envelope.rcpt_tos)
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp():
+    def start(failures=0):
+        handler = FlakyHandler(failures)
+        port = free_port()
+        controller = controller_module.Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        controllers.append(controller)
+        return handler, port
+
+    controllers = []
+    yield start
+    for controller in controllers:
+        controller.stop()
+
+
+def make_app(port):
+    app = Flask(__name__)
+    app.config.update(
+        MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_TLS=False, MAIL_USE_SSL=False,
+        MAIL_USERNAME='pos@localhost', MAIL_PASSWORD=None, HOSTNAME='http://localhost:5000'
+    )
+    return app
+
+
+def test_send_verification_email_delivers(smtp):
+    handler, port = smtp()
+    app = make_app(port)
+    service = MailService(Mail(app))
+
+    with app.app_context():
+        service.send_verification_email('a@example.com', 'token-1')
+        service.send_verification_email('b@example.com', 'token-2')
+
+    assert handler.received == [['a@example.com'], ['b@example.com']]
+
+
+def test_send_raises_on_failure_so_outbox_retries(smtp):
+    handler, port = smtp(failures=1)
+    app = make_app(port)
+    service = MailService(Mail(app))
+
+    with app.app_context():
+        with pytest.raises(Exception):
+            service.send_verification_email('a@example.com', 'token-1')
+        assert handler.received == []
+
+        # Outbox giao lại event: lần gửi sau thành công
+        service.send_verification_email('a@example.com', 'token-1')
+
+    assert handler.received == [['a@example.com']]
+
+
+def test_send_reconnects_after_idle_timeout(smtp):
+    handler, port = smtp()
+    app = make_app(port)
+    service = MailService(Mail(app), idle_timeout=0)
+
+    with app.app_context():
+        service.send('Test', ['a@example.com'], '<p>1</p>')
+        first = service._local.connection
+        service.send('Test', ['b@example.com'], '<p>2</p>')
+
+    assert service._local.connection is not first
+    assert handler.received == [['a@example.com'], ['b@example.com']]
+